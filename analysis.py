@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+import config
+from models import get_nlp
+from batching import MicroBatcher
+
+
+# Pipeline profiles: the components each call site can do without. Nothing reads the
+# dependency parse, reminders don't need lemmas, and NER is only used by the date fallback,
+# so it's added to a Doc on demand. Components are disabled per call rather than with
+# nlp.select_pipes, which would change the shared pipeline under other threads.
+INTENT = "intent"  # lemmas and tags for the spaCy intent tier
+REMINDER = "reminder"  # POS tags for Reminder.clean_message
+ENTITIES = "entities"  # date/time entities for the Reminder.extract_datetime fallback
+FULL = "full"
+PROFILES = {
+    INTENT: {"parser", "senter", "ner"},
+    REMINDER: {"parser", "senter", "lemmatizer", "ner"},
+    ENTITIES: {"parser", "senter", "tagger", "morphologizer", "attribute_ruler", "lemmatizer"},
+    FULL: set(),
+}
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def profile_components(nlp, profile: str) -> list:
+    return [name for name in nlp.pipe_names if name not in PROFILES[profile]]
+
+
+def applied_components(nlp, doc) -> set:
+    # Docs parsed outside these helpers went through the whole pipeline
+    return doc.user_data.setdefault("components", set(nlp.pipe_names))
+
+
+def parse(nlp, text: str, profile: str = REMINDER):
+    doc = nlp(text, disable=list(PROFILES[profile] & set(nlp.pipe_names)))
+    doc.user_data["components"] = set(profile_components(nlp, profile))
+    return doc
+
+
+def extend(nlp, doc, profile: str):
+    # Run the profile's components this Doc hasn't been through yet, in pipeline order;
+    # tok2vec listeners read the stored doc.tensor, so they can run on their own
+    applied = applied_components(nlp, doc)
+    missing = set(profile_components(nlp, profile)) - applied
+    if missing:
+        for name, component in nlp.pipeline:
+            if name in missing:
+                doc = component(doc)
+        applied.update(missing)
+    return doc
+
+
+class DocCache:
+    # Bounded LRU of parsed Docs keyed by normalized message text
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str):
+        with self._lock:
+            doc = self._docs.get(text)
+            if doc is not None:
+                self._docs.move_to_end(text)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return doc
+
+    def put(self, text: str, doc):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._docs[text] = doc
+            self._docs.move_to_end(text)
+            while len(self._docs) > self.maxsize:
+                self._docs.popitem(last=False)
+
+    def get_or_parse(self, nlp, text: str, profile: str = REMINDER):
+        doc = self.get(text)
+        if doc is None:
+            doc = parse(nlp, text, profile)
+            self.put(text, doc)
+            return doc
+        return extend(nlp, doc, profile)
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+
+
+doc_cache = DocCache(config.DOC_CACHE_SIZE)
+
+
+def parse_batch(texts: list, profile: str = REMINDER) -> list:
+    # Parse several messages with one nlp.pipe call, skipping ones already cached
+    nlp = get_nlp()
+    docs = [doc_cache.get(text) for text in texts]
+    missing = [text for text, doc in zip(texts, docs) if doc is None]
+    parsed = {}
+    if missing:
+        components = set(profile_components(nlp, profile))
+        disable = list(PROFILES[profile] & set(nlp.pipe_names))
+        parsed = dict(zip(missing, nlp.pipe(missing, batch_size=len(missing), disable=disable)))
+        for text, doc in parsed.items():
+            doc.user_data["components"] = set(components)
+            doc_cache.put(text, doc)
+    docs = [extend(nlp, doc, profile) if doc is not None else parsed[text] for text, doc in zip(texts, docs)]
+    return docs
+
+
+nlp_batcher = MicroBatcher(parse_batch, config.NLP_BATCH_WINDOW_MS, config.NLP_BATCH_MAX_SIZE)
+
+
+class MessageAnalysis:
+    # Per-update analysis context: the message is parsed at most once, on first use,
+    # and the same Doc is shared by intent recognition and reminder extraction.
+    def __init__(self, text: str, nlp=None):
+        self.text = normalize_text(text)
+        self._nlp = nlp
+        self._doc = None
+        # Time this message waited on spaCy, reported as the "spacy" stage
+        self.parse_seconds = 0.0
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            self._nlp = get_nlp()
+        return self._nlp
+
+    def doc_for(self, profile: str):
+        # The shared Doc, parsed or extended so it has the annotations the profile needs
+        start = time.perf_counter()
+        if self._doc is None:
+            self._doc = doc_cache.get_or_parse(self.nlp, self.text, profile)
+        else:
+            self._doc = extend(self.nlp, self._doc, profile)
+        self.parse_seconds += time.perf_counter() - start
+        return self._doc
+
+    @property
+    def doc(self):
+        return self.doc_for(REMINDER)
+
+    @doc.setter
+    def doc(self, doc):
+        self._doc = doc
+
+    @property
+    def is_parsed(self) -> bool:
+        return self._doc is not None
+
+    async def parse(self):
+        # Parse through the micro-batcher so concurrent messages share one nlp.pipe call;
+        # an explicitly supplied pipeline is parsed on its own
+        if self._doc is None:
+            start = time.perf_counter()
+            if self._nlp is not None:
+                self._doc = await asyncio.to_thread(doc_cache.get_or_parse, self._nlp, self.text)
+            else:
+                self._doc = await nlp_batcher.submit(self.text)
+            self.parse_seconds += time.perf_counter() - start
+        return self._doc
+
+    @property
+    def entities(self):
+        # (label, start_char, end_char, text) for every named entity
+        return [(ent.label_, ent.start_char, ent.end_char, ent.text) for ent in self.doc_for(ENTITIES).ents]
+
+    @property
+    def pos_spans(self):
+        # (start_char, end_char, pos) for every token
+        return [(token.idx, token.idx + len(token.text), token.pos_) for token in self.doc]
+
+    def tokens_outside(self, spans):
+        # Tokens that don't overlap any of the given (start_char, end_char) spans
+        return [
+            token for token in self.doc
+            if not any(token.idx < end and start < token.idx + len(token.text) for start, end in spans)
+        ]
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from logging_config import logger
+
+
+class MicroBatcher:
+    # Collects items submitted within a short window (or until max_batch_size is reached)
+    # and runs them through process_batch together, resolving each caller's future.
+    # process_batch takes a list of items and returns a list of results in the same order;
+    # it runs in a worker thread (on `executor` if given) so the event loop stays free while
+    # the batch is processed. A coroutine function is awaited directly instead.
+    def __init__(self, process_batch, window_ms: float, max_batch_size: int, executor=None):
+        self.process_batch = process_batch
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self.batch_count = 0
+        self.item_count = 0
+        self.max_batch_seen = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        started = time.perf_counter()
+        for _, _, submitted in batch:
+            wait = started - submitted
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        self.batch_count += 1
+        self.item_count += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+        try:
+            items = [item for item, _, _ in batch]
+            if asyncio.iscoroutinefunction(self.process_batch):
+                results = await self.process_batch(items)
+            elif self.executor is None:
+                results = await asyncio.to_thread(self.process_batch, items)
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(self.executor, self.process_batch, items)
+        except Exception as e:
+            logger.error("Error processing batch of %d items: %s", len(batch), e)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batch_count,
+            "items": self.item_count,
+            "mean_batch_size": self.item_count / self.batch_count if self.batch_count else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "mean_queue_wait_ms": self.total_wait / self.item_count * 1000 if self.item_count else 0.0,
+            "max_queue_wait_ms": self.max_wait * 1000,
+            "pending": len(self._pending),
+        }
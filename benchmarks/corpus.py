@@ -0,0 +1,48 @@
+import random
+
+# Fixed synthetic corpus: the same seed always yields the same messages, so runs compare
+
+TASKS = [
+    "call mom", "pay the rent", "water the plants", "submit the report", "book a dentist appointment",
+    "pick up the kids", "renew my passport", "buy groceries", "send the invoice to Alex", "take my medicine",
+    "walk the dog", "prepare slides for the meeting", "check the oven", "back up my laptop", "call the plumber",
+]
+
+# Date phrasings, from the compiled grammar's fast path to ones that need dateparser or spaCy
+TIME_PHRASES = [
+    "tomorrow at 5pm", "at 9:30", "in 20 minutes", "in 2 hours", "on friday", "next monday at 8am",
+    "tonight", "this evening", "on 12/24/2025", "at 17:45", "tomorrow morning", "in 3 days",
+    "on the 5th of march", "next week", "at noon on saturday", "the day after tomorrow at 10",
+]
+
+REMINDER_TEMPLATES = [
+    "remind me to {task} {time}",
+    "Remind me {time} to {task}",
+    "please remind me to {task} {time}",
+    "set a reminder to {task} {time}",
+    "don't let me forget to {task} {time}",
+    "{time} remind me to {task}",
+]
+
+GREETINGS = ["hi", "hello", "hey there", "good morning", "hello nous", "hey!", "hi, how are you?"]
+LIST_REQUESTS = ["list my reminders", "show my reminders", "what are my reminders?", "show me all reminders"]
+CLEAR_REQUESTS = ["clear all my reminders", "clear reminders", "delete all reminders"]
+DELETE_TEMPLATES = ["delete the reminder to {task}", "remove reminder {task}", "cancel {task}", "delete {task}"]
+QUERIES = ["what can you do?", "how does this work?", "what is this bot for?", "can you help me?"]
+
+
+def build_corpus(size: int = 50, seed: int = 0) -> dict:
+    # {category: [messages]} with size messages per category
+    rng = random.Random(seed)
+    corpus = {
+        "greeting": [rng.choice(GREETINGS) for _ in range(size)],
+        "reminder": [
+            rng.choice(REMINDER_TEMPLATES).format(task=rng.choice(TASKS), time=rng.choice(TIME_PHRASES))
+            for _ in range(size)
+        ],
+        "list_reminders": [rng.choice(LIST_REQUESTS) for _ in range(size)],
+        "delete_reminder": [rng.choice(DELETE_TEMPLATES).format(task=rng.choice(TASKS)) for _ in range(size)],
+        "clear_reminders": [rng.choice(CLEAR_REQUESTS) for _ in range(size)],
+        "query": [rng.choice(QUERIES) for _ in range(size)],
+    }
+    return corpus
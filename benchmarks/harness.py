@@ -0,0 +1,94 @@
+import gc
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, total_seconds: float, peak_bytes: int) -> dict:
+    values = sorted(latencies)
+    return {
+        "calls": len(values),
+        "throughput_per_s": len(values) / total_seconds if total_seconds else 0.0,
+        "mean_ms": statistics.fmean(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0,
+        "peak_memory_kib": peak_bytes / 1024,
+    }
+
+
+async def measure(calls: list, repeat: int = 1, warmup: int = 1) -> dict:
+    # calls: (prepare, call) pairs; prepare runs untimed before each call (e.g. to reset
+    # caches or seed the database), and either may be a coroutine function or a plain function.
+    # Peak memory is taken from a separate pass under tracemalloc so it doesn't skew the timings.
+    async def invoke(call):
+        result = call()
+        if hasattr(result, "__await__"):
+            await result
+
+    for prepare, call in calls[:warmup]:
+        await invoke(prepare)
+        await invoke(call)
+
+    latencies = []
+    gc.collect()
+    for _ in range(repeat):
+        for prepare, call in calls:
+            await invoke(prepare)
+            call_start = time.perf_counter()
+            await invoke(call)
+            latencies.append(time.perf_counter() - call_start)
+
+    tracemalloc.start()
+    try:
+        for prepare, call in calls:
+            await invoke(prepare)
+            await invoke(call)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Throughput counts timed calls only, not the untimed preparation between them
+    return summarize(latencies, sum(latencies), peak)
+
+
+def environment() -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def save(results: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    # Rows of (name, baseline p50, current p50, ratio, regressed) for benchmarks in both runs;
+    # a benchmark regressed when its median got slower by more than tolerance (0.2 = 20%)
+    rows = []
+    for name, result in current["benchmarks"].items():
+        before = baseline.get("benchmarks", {}).get(name)
+        if before is None or not before["p50_ms"]:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"]
+        rows.append((name, before["p50_ms"], result["p50_ms"], ratio, ratio > 1 + tolerance))
+    return rows
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+# Benchmarks run against an in-memory database and parse in-process, whatever .env says
+os.environ["MONGODB_URI"] = "mongomock://"
+os.environ["MONGODB_DB"] = "nous_benchmarks"
+os.environ["NLP_WORKERS"] = "0"
+os.environ["SCHEDULER_ENABLED"] = "false"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import config  # noqa: E402
+import handlers  # noqa: E402
+from analysis import FULL, INTENT, REMINDER, doc_cache, parse  # noqa: E402
+from benchmarks import harness  # noqa: E402
+from benchmarks.corpus import TASKS, build_corpus  # noqa: E402
+from fuzzy_index import reminder_index  # noqa: E402
+from intents import recognize_intent  # noqa: E402
+from message_cache import message_cache  # noqa: E402
+from models import get_nlp  # noqa: E402
+from reminder import Reminder  # noqa: E402
+from repository import reminders  # noqa: E402
+from workers import processor  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+
+SEEDED_REMINDERS = 30  # per user, for the list/delete/clear handlers
+
+
+def make_update(user_id: int, text: str):
+    update = MagicMock()
+    update.message.text = text
+    update.message.from_user.id = user_id
+    update.message.chat_id = user_id
+    update.message.reply_text = AsyncMock()
+    return update
+
+
+async def seed_user(user_id: int, count: int = SEEDED_REMINDERS):
+    await reminders.delete_by_user(user_id)
+    reminder_index.drop_user(user_id)
+    now = datetime.now()
+    # Together, so they go out in one buffered write
+    await asyncio.gather(*(reminders.insert({
+        "user_id": user_id,
+        "chat_id": user_id,
+        "reminder": TASKS[i % len(TASKS)],
+        "date": now + timedelta(hours=i + 1),
+        "delivered": False,
+    }) for i in range(count)))
+
+
+def noop():
+    pass
+
+
+def clear_parse_caches():
+    doc_cache.clear()
+    message_cache.clear()
+
+
+def handler_calls(handler, messages: list, first_user: int, seed: bool = False, per_message=None):
+    # One call per message, each from its own user so caches and indexes start cold
+    calls = []
+    for i, text in enumerate(messages):
+        user_id = first_user + i
+        update = make_update(user_id, text)
+        prepare = (lambda user_id=user_id: seed_user(user_id)) if seed else noop
+        if per_message is None:
+            call = lambda update=update: handler(update, None)
+        else:
+            call = lambda update=update, extra=per_message[i]: handler(update, None, extra)
+        calls.append((prepare, call))
+    return calls
+
+
+async def build_benchmarks(corpus: dict) -> dict:
+    # {name: [(prepare, call)]}
+    every_message = [text for messages in corpus.values() for text in messages]
+    benchmarks = {
+        "intent.recognize_intent": [(doc_cache.clear, lambda text=text: recognize_intent(text)) for text in every_message],
+    }
+
+    nlp = get_nlp()
+    if nlp is None:
+        print(f"spaCy model '{config.SPACY_MODEL}' is not available, skipping the reminder benchmarks", file=sys.stderr)
+    else:
+        # The whole pipeline against the trimmed per-call-site profiles
+        for profile in (FULL, INTENT, REMINDER):
+            benchmarks[f"spacy.parse.{profile}"] = [
+                (noop, lambda text=text, profile=profile: parse(nlp, text, profile)) for text in every_message
+            ]
+        parsed = [Reminder(0, text) for text in corpus["reminder"]]
+        benchmarks["reminder.extract_datetime"] = [
+            (noop, lambda reminder=reminder: reminder.extract_datetime(reminder.original_message)) for reminder in parsed
+        ]
+        benchmarks["reminder.clean_message"] = [
+            (noop, lambda reminder=reminder: reminder.clean_message(reminder.original_message)) for reminder in parsed
+        ]
+        results = [await processor.process(0, text) for text in corpus["reminder"]]
+        benchmarks["handler.handle_reminder"] = handler_calls(
+            handlers.handle_reminder, corpus["reminder"], 100_000, per_message=results)
+        # Full parses against message cache hits, which only re-run the date grammar
+        benchmarks["processor.process.uncached"] = [
+            (clear_parse_caches, lambda text=text: processor.process(0, text)) for text in corpus["reminder"]
+        ]
+        benchmarks["processor.process.cached"] = [
+            (lambda text=text: processor.process(0, text), lambda text=text: processor.process(0, text))
+            for text in corpus["reminder"]
+        ]
+
+    benchmarks["handler.list_reminders"] = handler_calls(handlers.list_reminders, corpus["list_reminders"], 200_000, seed=True)
+    benchmarks["handler.delete_reminder"] = handler_calls(handlers.delete_reminder, corpus["delete_reminder"], 300_000, seed=True)
+    benchmarks["handler.clear_reminders"] = handler_calls(handlers.clear_reminders, corpus["clear_reminders"], 400_000, seed=True)
+    benchmarks["handler.handle_query"] = handler_calls(handlers.handle_query, corpus["query"], 500_000)
+    for offset, (category, messages) in enumerate(corpus.items()):
+        seed = category in ("list_reminders", "delete_reminder", "clear_reminders")
+        benchmarks[f"handler.handle_message.{category}"] = handler_calls(
+            handlers.handle_message, messages, 1_000_000 * (offset + 1), seed=seed)
+    return benchmarks
+
+
+async def run(args) -> dict:
+    corpus = build_corpus(args.size, args.seed)
+    benchmarks = await build_benchmarks(corpus)
+    results = {
+        "environment": {
+            **harness.environment(),
+            "spacy_model": config.SPACY_MODEL,
+            "corpus_size": args.size,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "benchmarks": {},
+    }
+    for name, calls in benchmarks.items():
+        if args.only and args.only not in name:
+            continue
+        # Handlers that consume their seeded data are timed once per message
+        repeat = 1 if name.startswith("handler.") else args.repeat
+        results["benchmarks"][name] = await harness.measure(calls, repeat=repeat)
+        result = results["benchmarks"][name]
+        print(f"{name:45} {result['throughput_per_s']:10.1f}/s  p50 {result['p50_ms']:8.3f} ms  "
+              f"p95 {result['p95_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms  peak {result['peak_memory_kib']:9.1f} KiB")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NLP and handler hot paths")
+    parser.add_argument("--size", type=int, default=50, help="messages per corpus category")
+    parser.add_argument("--seed", type=int, default=0, help="corpus seed")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the corpus for the parsing benchmarks")
+    parser.add_argument("--only", help="run only benchmarks whose name contains this")
+    parser.add_argument("--output", default="benchmarks/results.json", help="where to write this run's results")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed median slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    harness.save(results, args.output)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        rows = harness.compare(results, harness.load(args.baseline), args.tolerance)
+        regressed = [row for row in rows if row[4]]
+        for name, before, after, ratio, slower in rows:
+            print(f"{name:45} {before:8.3f} -> {after:8.3f} ms  x{ratio:.2f}{'  REGRESSION' if slower else ''}")
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
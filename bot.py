@@ -1,11 +1,59 @@
-from telegram.ext import ApplicationBuilder, MessageHandler, filters
-from config import TELEGRAM_TOKEN
-from handlers import handle_message
+from telegram.ext import ApplicationBuilder, CallbackQueryHandler, MessageHandler, filters
+from config import (
+    CONCURRENT_UPDATES, SCHEDULER_ENABLED, TELEGRAM_BASE_URL, TELEGRAM_TOKEN, WARM_UP_MODELS,
+    WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL,
+)
+from handlers import delete_reminder_choice, handle_message, list_reminders_next_page
+from repository import reminders
+from models import registry
+from workers import processor
+from scheduler import scheduler
+from outbound import SCHEDULED, outbound
+from metrics import metrics, start_metrics_server
+from update_processor import PerChatUpdateProcessor
+
+async def post_init(app):
+    # Worker processes load their models on startup; in-process mode loads them
+    # in the background so polling starts right away
+    processor.start()
+    outbound.start(app.bot)
+    start_metrics_server()
+    await reminders.ensure_indexes()
+    if SCHEDULER_ENABLED:
+        await scheduler.start(lambda chat_id, text: outbound.send(chat_id, text, SCHEDULED))
+    if processor.workers <= 0 and WARM_UP_MODELS:
+        registry.warm_up(WARM_UP_MODELS)
+
+async def post_shutdown(app):
+    await scheduler.stop()
+    await outbound.stop()
+    processor.shutdown()
+    reminders.close()
+    metrics.stop()
 
 def main():
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .base_url(TELEGRAM_BASE_URL)
+        .concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    app.run_polling()
+    app.add_handler(CallbackQueryHandler(list_reminders_next_page, pattern=r'^list:'))
+    app.add_handler(CallbackQueryHandler(delete_reminder_choice, pattern=r'^del:'))
+    if WEBHOOK_URL:
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        app.run_polling()
 
 if __name__ == '__main__':
     main()
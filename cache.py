@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# Rough per-item overheads used to keep the cache inside its memory budget
+ENTRY_OVERHEAD_BYTES = 256
+REMINDER_OVERHEAD_BYTES = 200
+# Users remembered as having too many reminders to cache, so they skip the cache lookup
+MAX_OVERSIZED_USERS = 10000
+
+
+def sort_key(reminder: dict):
+    # Same order as the (date, _id) index; unmigrated string dates sort first
+    date = reminder['date']
+    return (date if isinstance(date, datetime) else datetime.min, reminder['_id'])
+
+
+def reminder_size(reminder: dict) -> int:
+    return REMINDER_OVERHEAD_BYTES + len(reminder['reminder'])
+
+
+class UserEntry:
+    __slots__ = ("reminders", "keys", "version", "loaded_at", "checked_at", "size")
+
+    def __init__(self, reminders: list, version, now: float):
+        self.reminders = sorted(reminders, key=sort_key)
+        self.keys = [sort_key(reminder) for reminder in self.reminders]
+        self.version = version
+        self.loaded_at = now
+        self.checked_at = now
+        self.size = ENTRY_OVERHEAD_BYTES + sum(reminder_size(reminder) for reminder in self.reminders)
+
+
+class ReminderCache:
+    # Per-user reminder summaries ({_id, reminder, date[, recurrence]}, sorted by due time) with LRU and
+    # TTL eviction inside a memory budget. Entries carry the user's version token from the
+    # reminder_versions collection; writes from this process update entries write-through,
+    # and entries older than revalidate_seconds are checked against the stored version so
+    # changes made by other processes are picked up.
+    def __init__(self, max_bytes: int, ttl_seconds: float, revalidate_seconds: float, max_reminders: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.revalidate = revalidate_seconds
+        self.max_reminders = max_reminders
+        self._entries = OrderedDict()
+        self._oversized = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "ttl": 0}
+        self.invalidations = 0
+
+    def get(self, user_id: int):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if now - entry.loaded_at > self.ttl:
+                self._drop(user_id)
+                self.evictions["ttl"] += 1
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def is_oversized(self, user_id: int) -> bool:
+        # Users over max_reminders go straight to MongoDB until their mark expires with the TTL
+        with self._lock:
+            marked_at = self._oversized.get(user_id)
+            if marked_at is None:
+                return False
+            if time.monotonic() - marked_at > self.ttl:
+                del self._oversized[user_id]
+                return False
+            return True
+
+    def mark_oversized(self, user_id: int):
+        with self._lock:
+            self._drop(user_id)
+            self._oversized[user_id] = time.monotonic()
+            self._oversized.move_to_end(user_id)
+            while len(self._oversized) > MAX_OVERSIZED_USERS:
+                self._oversized.popitem(last=False)
+
+    def needs_revalidation(self, entry: UserEntry) -> bool:
+        return time.monotonic() - entry.checked_at > self.revalidate
+
+    def mark_checked(self, entry: UserEntry):
+        entry.checked_at = time.monotonic()
+
+    def record_hit(self):
+        self.hits += 1
+
+    def record_miss(self):
+        self.misses += 1
+
+    def put(self, user_id: int, reminders: list, version):
+        if len(reminders) > self.max_reminders:
+            return
+        entry = UserEntry(reminders, version, time.monotonic())
+        with self._lock:
+            self._drop(user_id)
+            self._entries[user_id] = entry
+            self.size += entry.size
+            self._enforce_budget()
+
+    def _entry_for_write(self, user_id: int, version):
+        # The entry a write with the given resulting version can be applied to, if any
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if version is None or entry.version != version - 1:
+            self._drop(user_id)
+            self.invalidations += 1
+            return None
+        return entry
+
+    def add(self, user_id: int, reminder: dict, version):
+        with self._lock:
+            entry = self._entry_for_write(user_id, version)
+            if entry is None:
+                return
+            if len(entry.reminders) >= self.max_reminders:
+                self._drop(user_id)
+                return
+            summary = {"_id": reminder["_id"], "reminder": reminder["reminder"], "date": reminder["date"]}
+            if reminder.get("recurrence"):
+                summary["recurrence"] = reminder["recurrence"]
+            self._insert(entry, summary)
+            entry.version = version
+            self._enforce_budget()
+
+    def _insert(self, entry: UserEntry, summary: dict):
+        key = sort_key(summary)
+        index = bisect.bisect(entry.keys, key)
+        entry.keys.insert(index, key)
+        entry.reminders.insert(index, summary)
+        entry.size += reminder_size(summary)
+        self.size += reminder_size(summary)
+
+    def remove(self, user_id: int, reminder_id, version):
+        with self._lock:
+            entry = self._entry_for_write(user_id, version)
+            if entry is None:
+                return
+            for index, reminder in enumerate(entry.reminders):
+                if reminder["_id"] == reminder_id:
+                    del entry.reminders[index]
+                    del entry.keys[index]
+                    entry.size -= reminder_size(reminder)
+                    self.size -= reminder_size(reminder)
+                    break
+            entry.version = version
+
+    def reschedule(self, user_id: int, reminder_id, date: datetime, version):
+        # A recurring reminder moved on to its next occurrence
+        with self._lock:
+            entry = self._entry_for_write(user_id, version)
+            if entry is None:
+                return
+            for index, reminder in enumerate(entry.reminders):
+                if reminder["_id"] == reminder_id:
+                    del entry.reminders[index]
+                    del entry.keys[index]
+                    entry.size -= reminder_size(reminder)
+                    self.size -= reminder_size(reminder)
+                    self._insert(entry, dict(reminder, date=date))
+                    break
+            entry.version = version
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._oversized.pop(user_id, None)
+            if self._drop(user_id):
+                self.invalidations += 1
+
+    def _drop(self, user_id: int) -> bool:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return False
+        self.size -= entry.size
+        return True
+
+    def _enforce_budget(self):
+        while self.size > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry.size
+            self.evictions["lru"] += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "oversized_users": len(self._oversized),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": dict(self.evictions),
+            "invalidations": self.invalidations,
+        }
@@ -1,15 +1,105 @@
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Access the variables
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
+# Point at a local Bot API server (or a fake one for testing) instead of api.telegram.org
+TELEGRAM_BASE_URL = os.getenv('TELEGRAM_BASE_URL', 'https://api.telegram.org/bot')
 MONGO_URI = os.getenv('MONGODB_URI')
+MONGO_DB_NAME = os.getenv('MONGODB_DB', 'TechnitosNousBotDB')
 
-# Set up MongoDB connection
-client = MongoClient(MONGO_URI)
-db = client['TechnitosNousBotDB']
-reminders_collection = db['reminders']
+# MongoDB connection pool and timeouts (the client itself is created lazily in repository.py)
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', '20'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', '0'))
+MONGO_TIMEOUT_MS = int(os.getenv('MONGODB_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', '5000'))
+# Threads used to run blocking pymongo calls off the event loop
+MONGO_EXECUTOR_WORKERS = int(os.getenv('MONGODB_EXECUTOR_WORKERS', str(MONGO_MAX_POOL_SIZE)))
+# Write-behind buffer coalescing reminder inserts and deletes into bulk writes
+WRITE_BUFFER_ENABLED = os.getenv('WRITE_BUFFER_ENABLED', '1') == '1'
+WRITE_BUFFER_MAX_BATCH = int(os.getenv('WRITE_BUFFER_MAX_BATCH', '200'))
+WRITE_BUFFER_FLUSH_MS = float(os.getenv('WRITE_BUFFER_FLUSH_MS', '20'))
+# Per-user reminder cache for listing and deleting
+CACHE_ENABLED = os.getenv('CACHE_ENABLED', '1') == '1'
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', '600'))
+# How long a cached entry is trusted before its version is checked against MongoDB
+CACHE_REVALIDATE_SECONDS = float(os.getenv('CACHE_REVALIDATE_SECONDS', '5'))
+# Users with more pending reminders than this are always read from MongoDB
+CACHE_MAX_REMINDERS = int(os.getenv('CACHE_MAX_REMINDERS', '500'))
+
+# NLP models, loaded on first use by models.py
+SPACY_MODEL = os.getenv('SPACY_MODEL', 'en_core_web_sm')
+CLASSIFIER_MODEL = os.getenv('CLASSIFIER_MODEL', 'distilbert-base-uncased-finetuned-sst-2-english')
+# Directory written by model_store.py; models found there are loaded instead of the ones above
+MODEL_STORE_DIR = os.getenv('MODEL_STORE_DIR', '')
+# 'transformers' (TensorFlow pipeline) or 'onnx' (the exported classifier under MODEL_STORE_DIR)
+CLASSIFIER_RUNTIME = os.getenv('CLASSIFIER_RUNTIME', 'transformers')
+# Comma separated models to load in the background at startup, e.g. "spacy"; empty disables warm-up
+WARM_UP_MODELS = [name.strip() for name in os.getenv('WARM_UP_MODELS', 'spacy').split(',') if name.strip()]
+# Parsed spaCy Docs kept for repeated phrasings
+DOC_CACHE_SIZE = int(os.getenv('DOC_CACHE_SIZE', '1024'))
+# Parse results kept per message template (numbers abstracted); 0 disables the message cache
+MESSAGE_CACHE_SIZE = int(os.getenv('MESSAGE_CACHE_SIZE', '4096'))
+# Micro-batching of spaCy parses across concurrent messages
+NLP_BATCH_WINDOW_MS = float(os.getenv('NLP_BATCH_WINDOW_MS', '5'))
+NLP_BATCH_MAX_SIZE = int(os.getenv('NLP_BATCH_MAX_SIZE', '32'))
+# Worker processes for CPU-bound parsing; 0 runs everything in-process (useful for tests)
+NLP_WORKERS = int(os.getenv('NLP_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Messages allowed in flight to the workers before new ones wait
+NLP_MAX_PENDING = int(os.getenv('NLP_MAX_PENDING', str(max(1, NLP_WORKERS) * NLP_BATCH_MAX_SIZE * 2)))
+# Tasks a worker handles before it is replaced (needs Python 3.11+, 0 disables)
+NLP_WORKER_MAX_TASKS = int(os.getenv('NLP_WORKER_MAX_TASKS', '1000'))
+# 'spawn' loads the models in every worker; 'forkserver' loads them once and forks the workers
+# from there, sharing the weights (Unix only). 'fork' isn't offered: the bot process has threads,
+# and worker recycling (NLP_WORKER_MAX_TASKS) doesn't work with it.
+NLP_WORKER_START_METHOD = os.getenv('NLP_WORKER_START_METHOD', 'spawn')
+# Models the forkserver loads for its workers to share; independent of WARM_UP_MODELS, which only
+# concerns the bot process
+NLP_WORKER_PRELOAD_MODELS = [name.strip() for name in os.getenv('NLP_WORKER_PRELOAD_MODELS', 'spacy').split(',')
+                             if name.strip()]
+# Order of day and month in numeric dates like 12/03/2025 ("MDY" or "DMY")
+DATE_ORDER = os.getenv('DATE_ORDER', 'MDY').upper()
+# Reminders shown per page by list_reminders
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', '20'))
+# Per-user fuzzy index used by delete_reminder
+FUZZY_INDEX_MAX_USERS = int(os.getenv('FUZZY_INDEX_MAX_USERS', '10000'))
+FUZZY_SHORTLIST_SIZE = int(os.getenv('FUZZY_SHORTLIST_SIZE', '50'))
+# Intent cascade: model tiers only run for messages the keyword tier scores below this
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv('INTENT_CONFIDENCE_THRESHOLD', '0.8'))
+# Enable the classifier tier; CLASSIFIER_MODEL must then be trained with the intent names as labels
+INTENT_CLASSIFIER_TIER = os.getenv('INTENT_CLASSIFIER_TIER', '0') == '1'
+# Reminder delivery: how far ahead to load due reminders, and how many per refill query
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', '1') == '1'
+SCHEDULER_WINDOW_SECONDS = float(os.getenv('SCHEDULER_WINDOW_SECONDS', '300'))
+SCHEDULER_REFILL_BATCH = int(os.getenv('SCHEDULER_REFILL_BATCH', '5000'))
+# How often each partition looks for reminders inserted by other processes; 0 only refills
+SCHEDULER_POLL_SECONDS = float(os.getenv('SCHEDULER_POLL_SECONDS', '5'))
+# Failed sends are retried after DELIVERY_RETRY_SECONDS, doubling each time, up to DELIVERY_MAX_ATTEMPTS sends
+DELIVERY_RETRY_SECONDS = float(os.getenv('DELIVERY_RETRY_SECONDS', '30'))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', '5'))
+# Delivery is split into partitions by user id; each process leases a share of them
+DELIVERY_PARTITIONS = int(os.getenv('DELIVERY_PARTITIONS', '16'))
+DELIVERY_LEASE_SECONDS = float(os.getenv('DELIVERY_LEASE_SECONDS', '10'))
+# Updates handled concurrently; updates from one chat are still processed in order
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))
+# Webhook mode is used when WEBHOOK_URL (the public base URL) is set, long polling otherwise
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+# Outbound sends per second, overall and per chat (with a small burst allowance per chat)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+# Logging: level, "text" or "json" output, and the fraction of records below WARNING to keep
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+# Local Prometheus endpoint for stage latency histograms; 0 disables it
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
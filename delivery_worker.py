@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import signal
+from telegram import Bot
+from config import TELEGRAM_BASE_URL, TELEGRAM_TOKEN
+from logging_config import logger
+from repository import reminders
+from scheduler import scheduler
+from outbound import SCHEDULED, outbound
+from metrics import metrics, start_metrics_server
+
+# Delivery-only process: leases a share of the delivery partitions and sends the reminders
+# in them, without polling Telegram for updates. Run as many as needed next to bot.py.
+
+
+async def run(dry_run: bool):
+    await reminders.ensure_indexes()
+    start_metrics_server()
+    bot = None
+    if dry_run:
+        async def send(chat_id, text):
+            logger.info("[dry run] to %s: %s", chat_id, text)
+    else:
+        bot = Bot(TELEGRAM_TOKEN, base_url=TELEGRAM_BASE_URL)
+        await bot.initialize()
+        outbound.start(bot)
+
+        async def send(chat_id, text):
+            await outbound.send(chat_id, text, SCHEDULED)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows; Ctrl+C still raises KeyboardInterrupt
+
+    await scheduler.start(send)
+    logger.info("Delivery worker %s started", scheduler.leases.owner)
+    try:
+        await stop.wait()
+    finally:
+        await scheduler.stop()
+        if bot is not None:
+            await outbound.stop()
+            await bot.shutdown()
+        reminders.close()
+        metrics.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deliver reminders without polling Telegram")
+    parser.add_argument("--dry-run", action="store_true", help="log reminders instead of sending them")
+    args = parser.parse_args()
+    asyncio.run(run(args.dry_run))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import re
+import threading
+from collections import OrderedDict, defaultdict
+import config
+
+# rapidfuzz's C implementation is much faster; fuzzywuzzy keeps working without it
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    from fuzzywuzzy import fuzz, process
+
+# "please delete my reminder to ..." -> "..."
+COMMAND_PREFIX = re.compile(
+    r'^\s*(?:please\s+)?(?:can\s+you\s+)?(?:delete|remove|cancel)\s+(?:my\s+|the\s+|a\s+)?'
+    r'(?:reminders?\s+)?(?:to\s+|about\s+|for\s+|called\s+)?',
+    re.IGNORECASE,
+)
+
+
+def extract_target_phrase(message: str) -> str:
+    return COMMAND_PREFIX.sub('', message).strip(' .!?').lower()
+
+
+def ngrams(text: str, n: int = 3) -> set:
+    padded = f"  {text.lower()} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class UserIndex:
+    # Character trigram postings over one user's reminder texts, as of the user's version
+    def __init__(self, version=None):
+        self.texts = {}
+        self.postings = defaultdict(set)
+        self.version = version
+
+    def add(self, reminder_id, text: str):
+        self.texts[reminder_id] = text.lower()
+        for gram in ngrams(text):
+            self.postings[gram].add(reminder_id)
+
+    def remove(self, reminder_id):
+        text = self.texts.pop(reminder_id, None)
+        if text is None:
+            return
+        for gram in ngrams(text):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(reminder_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def shortlist(self, phrase: str, limit: int) -> dict:
+        counts = defaultdict(int)
+        for gram in ngrams(phrase):
+            for reminder_id in self.postings.get(gram, ()):
+                counts[reminder_id] += 1
+        best = sorted(counts, key=counts.get, reverse=True)[:limit]
+        return {reminder_id: self.texts[reminder_id] for reminder_id in best}
+
+
+class ReminderIndex:
+    # Per-user candidate index for delete_reminder. Users are loaded on first lookup and
+    # kept up to date write-through by the repository, using the same version tokens as the
+    # reminder cache: a write applies only on top of the version before it, otherwise the
+    # user is dropped, and a user whose stored version moved on (e.g. a delivery by another
+    # process) is reloaded. Least recently used users are dropped beyond max_users.
+    def __init__(self, max_users: int, shortlist_size: int):
+        self.max_users = max_users
+        self.shortlist_size = shortlist_size
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_current(self, user_id: int, version) -> bool:
+        index = self._users.get(user_id)
+        return index is not None and version is not None and index.version == version
+
+    def load(self, user_id: int, reminders: list, version=None):
+        index = UserIndex(version)
+        for reminder in reminders:
+            index.add(reminder['_id'], reminder['reminder'])
+        with self._lock:
+            self._users[user_id] = index
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def _index_for_write(self, user_id: int, version):
+        index = self._users.get(user_id)
+        if index is None:
+            return None
+        if version is None or index.version is None or index.version != version - 1:
+            del self._users[user_id]
+            return None
+        index.version = version
+        return index
+
+    def add(self, user_id: int, reminder_id, text: str, version):
+        with self._lock:
+            index = self._index_for_write(user_id, version)
+            if index is not None:
+                index.add(reminder_id, text)
+
+    def remove(self, user_id: int, reminder_id, version):
+        with self._lock:
+            index = self._index_for_write(user_id, version)
+            if index is not None:
+                index.remove(reminder_id)
+
+    def touch(self, user_id: int, version):
+        # A write that leaves the user's candidates as they are, e.g. a recurring reminder
+        # moving on to its next occurrence
+        with self._lock:
+            self._index_for_write(user_id, version)
+
+    def drop_user(self, user_id: int):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def count(self, user_id: int) -> int:
+        index = self._users.get(user_id)
+        return len(index.texts) if index is not None else 0
+
+    def search(self, user_id: int, phrase: str, k: int = 3, score_cutoff: int = 70) -> list:
+        # Top-k (reminder_id, text, score) for the phrase, best first
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                return []
+            self._users.move_to_end(user_id)
+            candidates = index.shortlist(phrase, self.shortlist_size)
+        if not candidates:
+            return []
+        matches = process.extract(phrase, candidates, scorer=fuzz.partial_ratio, limit=k)
+        # Both libraries return (text, score, key) for dict choices
+        return [(match[2], match[0], match[1]) for match in matches if match[1] > score_cutoff]
+
+
+reminder_index = ReminderIndex(config.FUZZY_INDEX_MAX_USERS, config.FUZZY_SHORTLIST_SIZE)
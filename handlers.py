@@ -1,120 +1,210 @@
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
-from reminder import Reminder
-from config import reminders_collection
-from intents import recognize_intent, nlp
-from fuzzywuzzy import fuzz
+from repository import reminders
+from workers import ParsedMessage, processor
+from scheduler import partition_for, scheduler
+from fuzzy_index import extract_target_phrase, reminder_index
 from logging_config import logger
-from datetime import datetime
+from outbound import reply
+from recurrence import describe
+from metrics import current_intent, metrics
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from config import LIST_PAGE_SIZE
 
-async def handle_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_message = update.message.text.strip()
-    reminder = Reminder(update.message.from_user.id, user_message, nlp)
+MAX_MESSAGE_LENGTH = 4096  # Telegram's limit for one text message
+EPOCH = datetime(1970, 1, 1)
+DELETE_CANDIDATES = 3  # matches offered when a delete is ambiguous
+DELETE_MARGIN = 10  # score lead needed to delete the best match without asking
 
-    if reminder.parsed_date:
+async def handle_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE, parsed: ParsedMessage):
+    if parsed.error:
+        logger.error("Error processing reminder: %s", parsed.error)
+        await reply(update.message, "There was an issue processing your reminder. Please try again later.")
+        return
+
+    if parsed.parsed_date:
         try:
             reminder_doc = {
-                "user_id": reminder.user_id,
-                "reminder": reminder.cleaned_message,
-                "date": reminder.parsed_date.strftime('%Y-%m-%d %H:%M:%S')
+                "user_id": update.message.from_user.id,
+                "chat_id": update.message.chat_id,
+                "reminder": parsed.cleaned_message,
+                "date": parsed.parsed_date,
+                "delivered": False,
+                "partition": partition_for(update.message.from_user.id)
             }
-            result = reminders_collection.insert_one(reminder_doc)
-            logger.debug(f"Reminder saved to database with id: {result.inserted_id}")
-            await update.message.reply_text(reminder.get_reminder_text())
+            if parsed.recurrence:
+                reminder_doc["recurrence"] = parsed.recurrence
+            inserted_id = await reminders.insert(reminder_doc)
+            scheduler.add(reminder_doc)
+            logger.debug("Reminder saved to database with id: %s", inserted_id)
+            await reply(update.message, parsed.reminder_text)
         except Exception as e:
-            logger.error(f"Error saving reminder to database: {e}")
-            await update.message.reply_text("There was an issue saving your reminder. Please try again.")
+            logger.error("Error saving reminder to database: %s", e)
+            await reply(update.message, "There was an issue saving your reminder. Please try again.")
     else:
-        await update.message.reply_text("I couldn't recognize the date or time in your reminder. Could you please specify when you want to be reminded?")
+        await reply(update.message, "I couldn't recognize the date or time in your reminder. Could you please specify when you want to be reminded?")
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    start = time.perf_counter()
     user_message = update.message.text
-    intent = recognize_intent(user_message)
-    logger.debug(f"User message: {user_message}")
-    logger.debug(f"Recognized intent: {intent}")
-    
-    if intent == "greeting":
-        await update.message.reply_text("Hello! How can I help you today? You can set a reminder or ask me a question.")
-    elif intent == "reminder":
-        await handle_reminder(update, context)
-    elif intent == "list_reminders":
-        await list_reminders(update, context)
-    elif intent == "clear_reminders":
-        await clear_reminders(update, context)
-    elif intent == "delete_reminder":
-        await delete_reminder(update, context)
-    elif intent == "query":
-        await handle_query(update, context)
-    else:
-        await update.message.reply_text("I'm not sure what you mean. Could you clarify?")
+    # Intent recognition and reminder parsing run in the NLP workers
+    parsed = await processor.process(update.message.from_user.id, user_message)
+    intent = parsed.intent
+    # Mongo and send timings further down are attributed to this intent
+    current_intent.set(intent)
+    logger.debug("Recognized intent %s", intent, extra={"user_id": update.message.from_user.id, "tier": parsed.intent_result.tier})
+
+    try:
+        if intent == "greeting":
+            await reply(update.message, "Hello! How can I help you today? You can set a reminder or ask me a question.")
+        elif intent == "reminder":
+            await handle_reminder(update, context, parsed)
+        elif intent == "list_reminders":
+            await list_reminders(update, context)
+        elif intent == "clear_reminders":
+            await clear_reminders(update, context)
+        elif intent == "delete_reminder":
+            await delete_reminder(update, context)
+        elif intent == "query":
+            await handle_query(update, context)
+        elif parsed.error:
+            await reply(update.message, "Sorry, I couldn't process that message. Please try again.")
+        else:
+            await reply(update.message, "I'm not sure what you mean. Could you clarify?")
+    finally:
+        metrics.observe("message", time.perf_counter() - start, intent)
+
+def format_reminder_line(reminder: dict) -> str:
+    # Dates are stored as datetimes; documents not yet migrated still hold strings
+    date = reminder['date']
+    date_display = date.strftime('%d %b %Y %H:%M') if isinstance(date, datetime) else date
+    if reminder.get('recurrence'):
+        return f"- {reminder['reminder']} {describe(reminder['recurrence'])}, next on {date_display}\n"
+    return f"- {reminder['reminder']} on {date_display}\n"
+
+def chunk_lines(lines, header: str = ""):
+    # Pack lines into messages that fit Telegram's length limit
+    chunk = header
+    for line in lines:
+        if len(line) > MAX_MESSAGE_LENGTH:
+            line = line[:MAX_MESSAGE_LENGTH - 2] + "…\n"
+        if len(chunk) + len(line) > MAX_MESSAGE_LENGTH:
+            yield chunk
+            chunk = ""
+        chunk += line
+    if chunk:
+        yield chunk
+
+def encode_page_token(reminder: dict):
+    # Callback data is limited to 64 bytes: "list:<epoch ms>:<object id>" fits
+    if not isinstance(reminder['date'], datetime):
+        return None
+    epoch_ms = int((reminder['date'] - EPOCH).total_seconds() * 1000)
+    return f"list:{epoch_ms}:{reminder['_id']}"
+
+def decode_page_token(data: str):
+    try:
+        _, epoch_ms, reminder_id = data.split(":")
+        return EPOCH + timedelta(milliseconds=int(epoch_ms)), ObjectId(reminder_id)
+    except (ValueError, InvalidId):
+        return None
+
+async def send_reminder_page(message, user_id: int, after: tuple = None):
+    page, has_more = await reminders.find_page(user_id, after, LIST_PAGE_SIZE)
+    if not page:
+        await reply(message, "You have no more reminders." if after else "You have no reminders set.")
+        return
+
+    logger.debug("Retrieved %d reminders", len(page), extra={"user_id": user_id})
+    header = "Here are your reminders:\n" if after is None else ""
+    chunks = list(chunk_lines((format_reminder_line(reminder) for reminder in page), header))
+    token = encode_page_token(page[-1]) if has_more else None
+    for i, chunk in enumerate(chunks):
+        markup = None
+        if token and i == len(chunks) - 1:
+            markup = InlineKeyboardMarkup([[InlineKeyboardButton("Next page", callback_data=token)]])
+        await reply(message, chunk, reply_markup=markup)
 
 async def list_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    reminders = list(reminders_collection.find({"user_id": user_id}))
-
-    if reminders:
-        response = "Here are your reminders:\n"
-        for reminder in reminders:
-            # Check if the date is in the expected datetime format
-            try:
-                if isinstance(reminder['date'], str):
-                    if reminder['date'].lower() in ["tomorrow", "today"]:
-                        date_display = reminder['date']  # Keep as is if it's a recognized string
-                    else:
-                        date = datetime.strptime(reminder['date'], '%Y-%m-%d %H:%M:%S')
-                        date_display = date.strftime('%d %b %Y %H:%M')
-                else:
-                    date_display = reminder['date'].strftime('%d %b %Y %H:%M')
-                
-                response += f"- {reminder['reminder']} on {date_display}\n"
-            except ValueError as e:
-                logger.error(f"Error parsing date: {reminder['date']} with error {e}")
-                response += f"- {reminder['reminder']} on {reminder['date']}\n"  # Fallback to original text
-
-        logger.debug(f"Retrieved reminders for user {user_id}: {reminders}")
-        await update.message.reply_text(response)
-    else:
-        await update.message.reply_text("You have no reminders set.")
+    await send_reminder_page(update.message, update.message.from_user.id)
+
+async def list_reminders_next_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    after = decode_page_token(query.data)
+    if after is None:
+        return
+    # Drop the button from the previous page so it can't be pressed twice
+    await query.edit_message_reply_markup(None)
+    await send_reminder_page(query.message, query.from_user.id, after)
 
 async def clear_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    result = reminders_collection.delete_many({"user_id": user_id})
+    deleted_count = await reminders.delete_by_user(user_id)
     
-    if result.deleted_count > 0:
-        logger.debug(f"Cleared {result.deleted_count} reminders for user {user_id}")
-        await update.message.reply_text(f"All your reminders have been cleared.")
+    if deleted_count > 0:
+        logger.debug("Cleared %d reminders", deleted_count, extra={"user_id": user_id})
+        await reply(update.message, f"All your reminders have been cleared.")
     else:
-        await update.message.reply_text("You have no reminders to clear.")
+        await reply(update.message, "You have no reminders to clear.")
 
 async def delete_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_message = update.message.text.lower()
     user_id = update.message.from_user.id
-    
-    reminders = list(reminders_collection.find({"user_id": user_id}))
-    if reminders:
-        best_match = None
-        best_score = 0
-        for reminder in reminders:
-            score = fuzz.partial_ratio(user_message, reminder['reminder'].lower())
-            if score > best_score:
-                best_score = score
-                best_match = reminder
-
-        if best_match and best_score > 70:  # Adjust the threshold as needed
-            reminders_collection.delete_one({"_id": best_match["_id"]})
-            await update.message.reply_text(f"Deleted reminder: {best_match['reminder']}")
-        else:
-            await update.message.reply_text("I couldn't find a matching reminder to delete. Could you try specifying it more clearly?")
-    else:
-        await update.message.reply_text("You have no reminders to delete.")
+    target = extract_target_phrase(update.message.text)
+
+    # Reload the candidates when the user's reminders changed outside this process's writes
+    version = await reminders.version_of(user_id)
+    if not reminder_index.is_current(user_id, version):
+        reminder_index.load(user_id, await reminders.find_by_user(user_id), version)
+    if reminder_index.count(user_id) == 0:
+        await reply(update.message, "You have no reminders to delete.")
+        return
+
+    matches = reminder_index.search(user_id, target, k=DELETE_CANDIDATES)
+    if not matches:
+        await reply(update.message, "I couldn't find a matching reminder to delete. Could you try specifying it more clearly?")
+        return
+
+    # Delete straight away only when the best match clearly beats the runner-up
+    if len(matches) == 1 or matches[0][2] - matches[1][2] >= DELETE_MARGIN:
+        reminder_id, text, _ = matches[0]
+        await delete_reminder_by_id(update.message, user_id, reminder_id, text)
+        return
+
+    keyboard = [[InlineKeyboardButton(text, callback_data=f"del:{reminder_id}")] for reminder_id, text, _ in matches]
+    await reply(update.message, "Which reminder do you want to delete?", reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def delete_reminder_by_id(message, user_id: int, reminder_id, text: str):
+    try:
+        await reminders.delete_by_id(reminder_id, user_id)
+    except Exception as e:
+        logger.error("Error deleting reminder %s: %s", reminder_id, e)
+        await reply(message, "There was an issue deleting your reminder. Please try again.")
+        return
+    await reply(message, f"Deleted reminder: {text}")
+
+async def delete_reminder_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    try:
+        reminder_id = ObjectId(query.data.split(":", 1)[1])
+    except InvalidId:
+        return
+    text = next((button.text for row in query.message.reply_markup.inline_keyboard for button in row
+                 if button.callback_data == query.data), "")
+    await query.edit_message_reply_markup(None)
+    await delete_reminder_by_id(query.message, query.from_user.id, reminder_id, text)
 
 async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_message = update.message.text.lower()
 
     if "what can you do" in user_message:
-        await update.message.reply_text("I can set reminders, list your reminders, delete them, and answer simple questions! Just tell me what you need.")
+        await reply(update.message, "I can set reminders, list your reminders, delete them, and answer simple questions! Just tell me what you need.")
     elif "how does this work" in user_message:
-        await update.message.reply_text("You can ask me to set reminders, and I'll make sure to remind you at the right time. Just say something like 'Remind me to call John at 5 PM'.")
+        await reply(update.message, "You can ask me to set reminders, and I'll make sure to remind you at the right time. Just say something like 'Remind me to call John at 5 PM'.")
     else:
-        await update.message.reply_text("I'm here to help! You can set reminders or ask me any questions.")
+        await reply(update.message, "I'm here to help! You can set reminders or ask me any questions.")
 
@@ -1,49 +1,199 @@
-import spacy
-from transformers import pipeline
+import re
+import threading
+import time
+import config
 from logging_config import logger
+from analysis import INTENT, parse
+from models import get_classifier, get_nlp
 
-# Load spaCy model
-try:
-    nlp = spacy.load("en_core_web_sm")
-    logger.debug("spaCy model loaded successfully.")
-except Exception as e:
-    logger.error(f"Error loading spaCy model: {e}")
-    nlp = None
+INTENTS = {"greeting", "reminder", "list_reminders", "clear_reminders", "delete_reminder", "query", "fallback"}
 
-# Load the text classification model from Hugging Face with TensorFlow backend
-classifier = pipeline("text-classification", model="distilbert-base-uncased-finetuned-sst-2-english", framework="tf")
+# Keyword and phrase table: token sequences mapped to the feature they signal
+KEYWORDS = {
+    ("remind",): "remind", ("reminder",): "reminders", ("reminders",): "reminders",
+    ("delete",): "delete", ("remove",): "delete", ("cancel",): "delete",
+    ("list",): "list", ("show",): "list",
+    ("clear",): "clear", ("clear", "all"): "clear_all",
+    ("hi",): "greet", ("hello",): "greet", ("hey",): "greet",
+    ("good", "morning"): "greet", ("good", "afternoon"): "greet", ("good", "evening"): "greet",
+    ("what",): "wh", ("how",): "wh", ("who",): "wh", ("where",): "wh", ("when",): "wh", ("why",): "wh",
+    ("what", "can", "you", "do"): "help", ("how", "does", "this", "work"): "help",
+}
+WORD = re.compile(r"[a-z']+")
+WH_TAGS = {"WDT", "WP", "WP$", "WRB"}
+COMMANDS = {"delete": "delete_reminder", "list": "list_reminders", "clear": "clear_reminders",
+            "clear_all": "clear_reminders"}
 
-def recognize_intent(user_message):
-    user_message = user_message.lower()
 
+def _build_trie(table: dict) -> dict:
+    trie = {}
+    for phrase, feature in table.items():
+        node = trie
+        for token in phrase:
+            node = node.setdefault(token, {})
+        node[None] = feature
+    return trie
+
+
+KEYWORD_TRIE = _build_trie(KEYWORDS)
+
+
+class IntentResult:
+    def __init__(self, intent: str, confidence: float, tier: str, timings: dict = None):
+        self.intent = intent
+        self.confidence = confidence
+        self.tier = tier
+        # Seconds spent in each tier that ran
+        self.timings = timings or {}
+
+
+def scan_keywords(tokens: list) -> dict:
+    # One pass over the tokens through the trie, longest match at each position;
+    # returns feature -> first token position
+    features = {}
+    i = 0
+    while i < len(tokens):
+        node = KEYWORD_TRIE
+        match = None
+        j = i
+        while j < len(tokens) and tokens[j] in node:
+            node = node[tokens[j]]
+            j += 1
+            if None in node:
+                match = (node[None], j)
+        if match:
+            features.setdefault(match[0], i)
+            i = match[1]
+        else:
+            i += 1
+    return features
+
+
+def decide(features: dict, is_question: bool, tier: str) -> IntentResult:
+    remind = features.get("remind")  # the verb: "remind me to ..."
+    noun = features.get("reminders")  # "reminder(s)"
+    # A command word only counts when the message starts with it or it applies to
+    # "reminder(s)"; in "remind me to clear the gutters" it is part of the reminder text.
+    # Clearing deletes everything, so a bare "clear ..." needs "clear all" to count.
+    commands = {name: position for name, position in features.items() if name in COMMANDS
+                and ((noun is not None and position < noun) or (position == 0 and name != "clear"))}
+    first_command = min(commands, key=commands.get) if commands else None
+    conflicting = any(name in features for name in COMMANDS) or "wh" in features
+
+    if remind is not None and (first_command is None or remind < commands[first_command]):
+        # Command or question words inside a reminder leave it less certain, so the model tiers decide
+        return IntentResult("reminder", 0.6 if conflicting else 0.9, tier)
+    if first_command is not None:
+        # "show John the house" starts with a command word but says nothing about reminders
+        return IntentResult(COMMANDS[first_command], 0.95 if noun is not None else 0.7, tier)
+    if noun is not None:
+        if "wh" in features and features["wh"] < noun:
+            return IntentResult("list_reminders", 0.85, tier)
+        return IntentResult("reminder", 0.6 if conflicting else 0.9, tier)
+    if "help" in features:
+        return IntentResult("query", 0.95, tier)
+    if "greet" in features:
+        return IntentResult("greeting", 0.9 if features["greet"] == 0 else 0.6, tier)
+    if "wh" in features:
+        return IntentResult("query", 0.85 if features["wh"] == 0 or is_question else 0.5, tier)
+    if is_question:
+        return IntentResult("query", 0.6, tier)
+    return IntentResult("fallback", 0.0, tier)
+
+
+def keyword_tier(text: str, analysis=None):
+    return decide(scan_keywords(WORD.findall(text)), text.rstrip().endswith("?"), "keywords")
+
+
+def spacy_tier(text: str, analysis=None):
+    # Lemmas catch inflections ("reminding", "deleted") and tags catch questions without a '?'
+    nlp = analysis.nlp if analysis is not None else get_nlp()
     if nlp is None:
-        logger.error("spaCy model is not available. Cannot process the message with spaCy.")
-        return "error"
-
-    try:
-        doc = nlp(user_message)
-    except Exception as e:
-        logger.error(f"Error processing message with spaCy: {e}")
-        return "error"
-    
-    # First, let's classify the message
-    classification = classifier(user_message)[0]
-    
-    # Recognize query intent based on keywords
-    if any(keyword in user_message for keyword in ["what", "how", "who", "where", "when", "why"]):
-        return "query"
-
-    # Recognize reminder intent based on keywords
-    if "remind" in user_message or "reminder" in user_message:
-        if "delete" in user_message or "remove" in user_message:
-            return "delete_reminder"
-        if "list" in user_message or "show" in user_message:
-            return "list_reminders"
-        if "clear all" in user_message or "clear" in user_message:
-            return "clear_reminders"
-        return "reminder"
-    
-    if "hello" in user_message or "hi" in user_message or "hey" in user_message:
-        return "greeting"
-    
-    return "fallback"
+        return None
+    doc = analysis.doc_for(INTENT) if analysis is not None else parse(nlp, text, INTENT)
+    lemmas = [token.lemma_.lower() or token.lower_ for token in doc]
+    is_question = text.rstrip().endswith("?")
+    if not is_question and len(doc):
+        # The intent profile skips the parser, so without sentence boundaries only the
+        # message's first word is checked
+        sents = doc.sents if doc.has_annotation("SENT_START") else [doc]
+        is_question = any(sent[0].tag_ in WH_TAGS for sent in sents)
+    return decide(scan_keywords(lemmas), is_question, "spacy")
+
+
+def classifier_tier(text: str, analysis=None):
+    # Only meaningful with a model fine-tuned on the intent names as labels
+    if not config.INTENT_CLASSIFIER_TIER:
+        return None
+    classifier = get_classifier()
+    if classifier is None:
+        return None
+    prediction = classifier(text)[0]
+    label = prediction["label"].lower()
+    if label not in INTENTS:
+        return None
+    return IntentResult(label, float(prediction["score"]), "classifier")
+
+
+TIERS = [("keywords", keyword_tier), ("spacy", spacy_tier), ("classifier", classifier_tier)]
+
+
+def classify_intent(user_message: str, analysis=None, threshold: float = None) -> IntentResult:
+    # Cheapest tier first; the model tiers only see messages the keywords can't settle
+    threshold = config.INTENT_CONFIDENCE_THRESHOLD if threshold is None else threshold
+    text = user_message.lower()
+    best = None
+    timings = {}
+    for name, tier in TIERS:
+        start = time.perf_counter()
+        try:
+            result = tier(text, analysis)
+        except Exception as e:
+            logger.error("Error in intent tier '%s': %s", name, e)
+            result = None
+        timings[name] = time.perf_counter() - start
+        if result is not None and (best is None or result.confidence > best.confidence):
+            best = result
+        if best is not None and best.confidence >= threshold:
+            break
+    if best is None:
+        best = IntentResult("fallback", 0.0, "keywords")
+    best.timings = timings
+    return best
+
+
+class CascadeStats:
+    # Per-tier counters: how many messages reached a tier, how many it decided, time spent
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.messages = 0
+        self.tiers = {name: {"reached": 0, "decided": 0, "seconds": 0.0} for name, _ in TIERS}
+
+    def record(self, result: IntentResult):
+        with self._lock:
+            self.messages += 1
+            for name, seconds in result.timings.items():
+                self.tiers[name]["reached"] += 1
+                self.tiers[name]["seconds"] += seconds
+            self.tiers[result.tier]["decided"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "reached": tier["reached"],
+                    "decided": tier["decided"],
+                    "hit_rate": tier["decided"] / self.messages if self.messages else 0.0,
+                    "mean_latency_ms": tier["seconds"] / tier["reached"] * 1000 if tier["reached"] else 0.0,
+                }
+                for name, tier in self.tiers.items()
+            }
+
+
+cascade_stats = CascadeStats()
+
+
+def recognize_intent(user_message, analysis=None):
+    result = classify_intent(user_message, analysis)
+    cascade_stats.record(result)
+    return result.intent
@@ -0,0 +1,136 @@
+import asyncio
+import math
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from logging_config import logger
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def utcnow() -> datetime:
+    # Leases are compared across processes and hosts, so always use naive UTC like pymongo returns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def make_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseManager:
+    # Claims delivery partitions through lease documents ({_id: partition, owner, expires_at}).
+    # Every live process heartbeats a member document, aims for an even share of the
+    # partitions, renews its own leases and takes over expired ones, so a crashed
+    # process's partitions are picked up once its leases run out.
+    def __init__(self, database, partitions: int, lease_seconds: float, on_acquire, on_release, owner: str = None):
+        self.database = database
+        self.partitions = partitions
+        self.lease = timedelta(seconds=lease_seconds)
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.owner = owner or make_owner_id()
+        self.owned = set()
+        self._task = None
+
+    @property
+    def leases(self):
+        return self.database['delivery_leases']
+
+    @property
+    def members(self):
+        return self.database['delivery_members']
+
+    async def start(self):
+        await asyncio.to_thread(self._create_leases)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Hand the partitions back right away instead of waiting for the leases to expire
+        for partition in list(self.owned):
+            await self._release(partition)
+        await asyncio.to_thread(self.members.delete_one, {"_id": self.owner})
+
+    def _create_leases(self):
+        for partition in range(self.partitions):
+            try:
+                self.leases.update_one(
+                    {"_id": partition},
+                    {"$setOnInsert": {"owner": None, "expires_at": EPOCH}},
+                    upsert=True,
+                )
+            except DuplicateKeyError:
+                pass  # another process created it first
+
+    async def _run(self):
+        while True:
+            try:
+                await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error maintaining delivery leases: %s", e)
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+
+    async def _tick(self):
+        now = utcnow()
+        expires_at = now + self.lease
+        live = await asyncio.to_thread(self._heartbeat, now, expires_at)
+        target = math.ceil(self.partitions / max(1, live))
+
+        for partition in list(self.owned):
+            if not await asyncio.to_thread(self._renew, partition, expires_at):
+                logger.warning("Lost lease on delivery partition %d", partition)
+                self.owned.discard(partition)
+                await self.on_release(partition)
+
+        # Give up extras when other processes joined, take free or expired partitions otherwise
+        while len(self.owned) > target:
+            await self._release(max(self.owned))
+        if len(self.owned) < target:
+            free = await asyncio.to_thread(
+                lambda: [lease["_id"] for lease in self.leases.find({"expires_at": {"$lt": now}}, {"_id": 1})]
+            )
+            for partition in free:
+                if len(self.owned) >= target:
+                    break
+                if await asyncio.to_thread(self._acquire, partition, now, expires_at):
+                    logger.info("%s acquired delivery partition %d", self.owner, partition)
+                    self.owned.add(partition)
+                    await self.on_acquire(partition)
+
+    def _heartbeat(self, now: datetime, expires_at: datetime) -> int:
+        self.members.update_one({"_id": self.owner}, {"$set": {"expires_at": expires_at}}, upsert=True)
+        return self.members.count_documents({"expires_at": {"$gt": now}})
+
+    def _renew(self, partition: int, expires_at: datetime) -> bool:
+        result = self.leases.update_one({"_id": partition, "owner": self.owner}, {"$set": {"expires_at": expires_at}})
+        return result.matched_count == 1
+
+    def _acquire(self, partition: int, now: datetime, expires_at: datetime) -> bool:
+        # Only succeeds if the lease is still expired when the update runs
+        result = self.leases.find_one_and_update(
+            {"_id": partition, "expires_at": {"$lt": now}},
+            {"$set": {"owner": self.owner, "expires_at": expires_at}},
+            return_document=ReturnDocument.AFTER,
+        )
+        return result is not None
+
+    async def _release(self, partition: int):
+        self.owned.discard(partition)
+        await self.on_release(partition)
+        await asyncio.to_thread(
+            self.leases.update_one,
+            {"_id": partition, "owner": self.owner},
+            {"$set": {"owner": None, "expires_at": EPOCH}},
+        )
+        logger.info("%s released delivery partition %d", self.owner, partition)
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict, deque
+import tornado.web
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+# Local stand-in for the Telegram Bot API: hands out injected updates through getUpdates or
+# pushes them to the webhook the bot registers, and records every sendMessage. Point the bot
+# at it with TELEGRAM_BASE_URL=http://127.0.0.1:<port>/bot
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "nous", "username": "nous_loadtest_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+
+class FakeBotAPI:
+    def __init__(self, retry_after_rate: float = 0.0, retry_after: int = 1):
+        # retry_after_rate: fraction of sendMessage calls answered with a 429
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self._updates = deque()
+        self._update_available = asyncio.Event()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._http = None
+        self._closed = False
+        # Injection times of updates still waiting for a reply, per chat
+        self._awaiting_reply = defaultdict(deque)
+        self.latencies = []
+        self.replies = []
+        self.errors = defaultdict(int)
+        self.calls = defaultdict(int)
+
+    def inject(self, user_id: int, text: str) -> int:
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        update = {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": f"user{user_id}"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "text": text,
+            },
+        }
+        self._awaiting_reply[user_id].append(time.perf_counter())
+        if self.webhook_url:
+            asyncio.ensure_future(self._push(update))
+        else:
+            self._updates.append(update)
+            self._update_available.set()
+        return update_id
+
+    async def _push(self, update: dict):
+        if self._http is None:
+            self._http = AsyncHTTPClient(max_clients=1000)
+        headers = {"Content-Type": "application/json"}
+        if self.webhook_secret:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.webhook_secret
+        try:
+            await self._http.fetch(self.webhook_url, method="POST", body=json.dumps(update), headers=headers,
+                                   request_timeout=60)
+        except HTTPClientError as e:
+            self.errors[f"webhook_{e.code}"] += 1
+        except Exception as e:
+            self.errors[f"webhook_{type(e).__name__}"] += 1
+
+    async def get_updates(self, offset: int, timeout: float, limit: int) -> list:
+        # Long polling: updates below offset are confirmed, so drop them, then wait for more
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout > 0 and not self._closed:
+            self._update_available.clear()
+            try:
+                await asyncio.wait_for(self._update_available.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return [update for _, update in zip(range(limit), self._updates)]
+
+    def record_reply(self, chat_id: int, text: str):
+        # The first reply to a chat after an update is that update's reply; further messages
+        # for the same update (e.g. long lists) have nothing left to match
+        now = time.perf_counter()
+        waiting = self._awaiting_reply.get(chat_id)
+        if waiting:
+            self.latencies.append(now - waiting.popleft())
+        self.replies.append((now, chat_id, text))
+        if text.startswith("There was an issue"):
+            self.errors["error_reply"] += 1
+
+    def close(self):
+        # Answers pending long polls so the server can stop cleanly
+        self._closed = True
+        self._update_available.set()
+
+    def unanswered(self) -> int:
+        return sum(len(waiting) for waiting in self._awaiting_reply.values())
+
+    def reset_stats(self):
+        self._awaiting_reply.clear()
+        self.latencies = []
+        self.replies = []
+        self.errors = defaultdict(int)
+        self.calls = defaultdict(int)
+
+    def message(self, chat_id: int, text: str) -> dict:
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        return {"message_id": message_id, "date": int(time.time()), "from": BOT_USER,
+                "chat": {"id": chat_id, "type": "private"}, "text": text}
+
+    def make_app(self) -> tornado.web.Application:
+        return tornado.web.Application([(r"/bot([^/]+)/(\w+)", MethodHandler, {"api": self})])
+
+
+class MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, api: FakeBotAPI):
+        self.api = api
+
+    def params(self) -> dict:
+        # python-telegram-bot posts form fields, with JSON-encoded values for non-strings
+        if self.request.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(self.request.body or b"{}")
+        return {name: self.get_argument(name) for name in self.request.arguments}
+
+    def ok(self, result):
+        self.write({"ok": True, "result": result})
+
+    async def get(self, token: str, method: str):
+        await self.post(token, method)
+
+    async def post(self, token: str, method: str):
+        api = self.api
+        api.calls[method] += 1
+        params = self.params()
+        if method == "getMe":
+            self.ok(BOT_USER)
+        elif method == "getUpdates":
+            self.ok(await api.get_updates(int(params.get("offset", 0)), float(params.get("timeout", 0)),
+                                          int(params.get("limit", 100))))
+        elif method == "setWebhook":
+            api.webhook_url = params.get("url")
+            api.webhook_secret = params.get("secret_token")
+            self.ok(True)
+        elif method == "deleteWebhook":
+            api.webhook_url = None
+            self.ok(True)
+        elif method == "sendMessage":
+            if api.retry_after_rate and random.random() < api.retry_after_rate:
+                api.errors["retry_after"] += 1
+                self.set_status(429)
+                self.write({"ok": False, "error_code": 429, "description": "Too Many Requests",
+                            "parameters": {"retry_after": api.retry_after}})
+                return
+            chat_id = int(params["chat_id"])
+            api.record_reply(chat_id, params.get("text", ""))
+            self.ok(api.message(chat_id, params.get("text", "")))
+        elif method in ("answerCallbackQuery", "editMessageReplyMarkup", "close", "logOut"):
+            self.ok(True)
+        else:
+            api.errors[f"unsupported_{method}"] += 1
+            self.set_status(400)
+            self.write({"ok": False, "error_code": 400, "description": f"Unsupported method {method}"})
+
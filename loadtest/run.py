@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from benchmarks.corpus import build_corpus
+from benchmarks.harness import percentile
+from loadtest.fake_bot_api import FakeBotAPI
+
+# Open-loop load test of one bot.py instance: replays a mix of intents from many simulated
+# users at increasing rates through a local fake Bot API, and reports reply latency, errors
+# and the rate at which the bot stops keeping up.
+
+DEFAULT_MIX = "greeting=2,reminder=5,list_reminders=2,delete_reminder=1,clear_reminders=0.5,query=1"
+FIRST_USER_ID = 10_000
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        category, _, weight = part.partition("=")
+        weights[category.strip()] = float(weight or 1)
+    return weights
+
+
+def spawn_bot(args) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_TOKEN": "1:loadtest",
+        "TELEGRAM_BASE_URL": f"http://127.0.0.1:{args.port}/bot",
+    })
+    if args.mode == "webhook":
+        env.update({
+            "WEBHOOK_URL": f"http://127.0.0.1:{args.webhook_port}",
+            "WEBHOOK_LISTEN": "127.0.0.1",
+            "WEBHOOK_PORT": str(args.webhook_port),
+        })
+    else:
+        env.pop("WEBHOOK_URL", None)
+    return subprocess.Popen([sys.executable, "bot.py"], env=env)
+
+
+async def wait_for_bot(api: FakeBotAPI, mode: str, timeout: float):
+    # The bot is up once it polls for updates or registers its webhook
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if (mode == "polling" and api.calls["getUpdates"]) or (mode == "webhook" and api.webhook_url):
+            return
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"bot did not connect to the fake Bot API within {timeout:.0f}s")
+
+
+async def run_step(api: FakeBotAPI, rng: random.Random, corpus: dict, weights: dict, users: int,
+                   rate: float, duration: float, drain: float) -> dict:
+    api.reset_stats()
+    categories = list(weights)
+    category_weights = [weights[category] for category in categories]
+    injected = 0
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    next_at = start
+    # Poisson arrivals at the target rate, scheduled against the clock so slow steps don't drift
+    while next_at - start < duration:
+        delay = next_at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        category = rng.choices(categories, category_weights)[0]
+        api.inject(FIRST_USER_ID + rng.randrange(users), rng.choice(corpus[category]))
+        injected += 1
+        next_at += rng.expovariate(rate)
+    sent_for = loop.time() - start
+    replied_in_window = len(api.latencies)
+
+    drain_deadline = loop.time() + drain
+    while api.unanswered() and loop.time() < drain_deadline:
+        await asyncio.sleep(0.1)
+
+    latencies = sorted(api.latencies)
+    unanswered = api.unanswered()
+    errors = unanswered + sum(api.errors.get(kind, 0) for kind in api.errors if kind != "retry_after")
+    return {
+        "target_rate": rate,
+        "injected": injected,
+        "offered_rate": injected / sent_for if sent_for else 0.0,
+        "reply_rate": replied_in_window / sent_for if sent_for else 0.0,
+        "replied": len(latencies),
+        "unanswered": unanswered,
+        "error_rate": errors / injected if injected else 0.0,
+        "errors": dict(api.errors),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+def saturated(step: dict, slo_ms: float, max_error_rate: float) -> bool:
+    return (step["p95_ms"] > slo_ms or step["error_rate"] > max_error_rate
+            or step["reply_rate"] < 0.9 * step["offered_rate"])
+
+
+async def run(args) -> dict:
+    # Tornado logs every 4xx, which would print each injected 429
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)
+    api = FakeBotAPI(args.retry_after_rate)
+    server = api.make_app().listen(args.port, address="127.0.0.1")
+    bot = spawn_bot(args) if args.spawn else None
+    if bot is None:
+        print(f"Fake Bot API on http://127.0.0.1:{args.port}/bot; start the bot with "
+              f"TELEGRAM_BASE_URL=http://127.0.0.1:{args.port}/bot TELEGRAM_TOKEN=1:loadtest python bot.py")
+    try:
+        await wait_for_bot(api, args.mode, args.startup_timeout)
+        rng = random.Random(args.seed)
+        corpus = build_corpus(200, args.seed)
+        weights = parse_mix(args.mix)
+        steps = []
+        saturation = None
+        for rate in args.rates:
+            step = await run_step(api, rng, corpus, weights, args.users, rate, args.duration, args.drain)
+            steps.append(step)
+            flag = saturated(step, args.slo_ms, args.max_error_rate)
+            print(f"{rate:8.1f}/s offered {step['offered_rate']:8.1f}/s replied {step['reply_rate']:8.1f}/s  "
+                  f"p50 {step['p50_ms']:8.1f} ms  p95 {step['p95_ms']:8.1f} ms  p99 {step['p99_ms']:8.1f} ms  "
+                  f"errors {step['error_rate']:6.2%}{'  SATURATED' if flag else ''}")
+            if flag and saturation is None:
+                saturation = rate
+                if not args.keep_going:
+                    break
+        return {
+            "mode": args.mode,
+            "users": args.users,
+            "mix": weights,
+            "slo_p95_ms": args.slo_ms,
+            "saturation_rate": saturation,
+            "steps": steps,
+        }
+    finally:
+        api.close()
+        if bot is not None:
+            bot.terminate()
+            try:
+                bot.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+        await asyncio.sleep(0.1)
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test bot.py against a local fake Bot API")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--spawn", action="store_true", help="start bot.py pointed at the fake API")
+    parser.add_argument("--port", type=int, default=8081, help="fake Bot API port")
+    parser.add_argument("--webhook-port", type=int, default=8443, help="bot's webhook port when spawned in webhook mode")
+    parser.add_argument("--users", type=int, default=5000, help="simulated users")
+    parser.add_argument("--rates", type=lambda value: [float(rate) for rate in value.split(",")],
+                        default=[5, 10, 20, 50, 100, 200], help="messages per second, one step each")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per step")
+    parser.add_argument("--drain", type=float, default=10, help="seconds to wait for outstanding replies after a step")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="intent weights, e.g. reminder=5,greeting=1")
+    parser.add_argument("--slo-ms", type=float, default=1000, help="p95 reply latency above which a step is saturated")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="fraction of sends answered with a 429")
+    parser.add_argument("--keep-going", action="store_true", help="run every step even after saturation")
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if report["saturation_rate"] is None:
+        print("Not saturated at any tested rate")
+    else:
+        print(f"Saturated at {report['saturation_rate']:.1f} messages/s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,50 @@
+import json
 import logging
+import random
+import config
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Attributes every LogRecord has; anything else on a record came in through extra={...}
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class StructuredFormatter(logging.Formatter):
+    # One line per record with the fields passed through extra={...} appended as key=value,
+    # or a JSON object per line when json_lines is set
+    def __init__(self, json_lines: bool = False):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+        if self.json_lines:
+            entry = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                entry["exc_info"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        line = super().format(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    # Keeps every warning and error, and only a fraction of everything below
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+_handler = logging.StreamHandler()
+_handler.setFormatter(StructuredFormatter(json_lines=config.LOG_FORMAT == "json"))
+_handler.addFilter(SamplingFilter(config.LOG_SAMPLE_RATE))
+logging.basicConfig(level=config.LOG_LEVEL, handlers=[_handler])
 logger = logging.getLogger(__name__)
@@ -0,0 +1,98 @@
+import re
+import threading
+from collections import OrderedDict
+import config
+from analysis import normalize_text
+from timeparse import NUMBER_WORDS
+
+# Numbers and number words ("in 2 hours", "at 9:30pm", "in ten minutes") are abstracted so
+# messages that differ only in them share a template; "a"/"an" are left as words
+SLOT = re.compile(r"\d+|\b(?:" + "|".join(word for word in NUMBER_WORDS if len(word) > 2) + r")\b", re.IGNORECASE)
+
+
+def message_template(text: str) -> str:
+    return SLOT.sub("#", normalize_text(text))
+
+
+class CachedParse:
+    __slots__ = ("intent_result", "cleaned_message", "date_source")
+
+    def __init__(self, intent_result, cleaned_message: str = None, date_source: str = None):
+        self.intent_result = intent_result
+        self.cleaned_message = cleaned_message
+        self.date_source = date_source
+
+
+class MessageCache:
+    # Bounded LRU of parse results keyed by message template. Only what holds for every
+    # message of the template is kept: the intent and the cleaned reminder text. Dates are
+    # never stored; a hit re-runs the date grammar on the message itself, so the date is
+    # anchored to now, and reminders whose date needed dateparser or spaCy are not cached.
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+
+    def get(self, text: str):
+        if self.maxsize <= 0:
+            return None
+        key = message_template(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def record_hit(self):
+        self.hits += 1
+
+    def record_miss(self):
+        self.misses += 1
+
+    def put(self, text: str, parsed) -> bool:
+        # parsed is a ParsedMessage; returns whether it could be cached
+        if self.maxsize <= 0:
+            return False
+        entry = self._entry_for(parsed)
+        if entry is None:
+            self.uncacheable += 1
+            return False
+        key = message_template(text)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return True
+
+    def _entry_for(self, parsed):
+        if parsed.error:
+            return None
+        if parsed.intent != "reminder":
+            return CachedParse(parsed.intent_result)
+        if parsed.date_source != "grammar" or not parsed.cleaned_message:
+            return None
+        # A number left in the reminder text would be replayed for every message of the template
+        if SLOT.search(parsed.cleaned_message):
+            return None
+        return CachedParse(parsed.intent_result, parsed.cleaned_message, parsed.date_source)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncacheable": self.uncacheable,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+message_cache = MessageCache(config.MESSAGE_CACHE_SIZE)
@@ -0,0 +1,163 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config
+from logging_config import logger
+
+# Upper bounds in seconds, Prometheus' default histogram buckets plus a few finer ones
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Intent of the message being handled, so stages deep in the call stack (Mongo, send) can
+# be attributed to it without threading it through every call
+current_intent = contextvars.ContextVar("current_intent", default="none")
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Linear interpolation within the bucket holding the q-th observation, as
+        # Prometheus' histogram_quantile does; the +Inf bucket reports the largest bound
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    # Latency histograms per (stage, intent). Stages: intent, spacy, dateparser, mongo, send,
+    # and message for the whole handling of an update. Plain counters (e.g. cache lookups)
+    # are kept alongside them.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._server = None
+
+    def observe(self, stage: str, seconds: float, intent: str = None):
+        key = (stage, intent or current_intent.get())
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    @contextmanager
+    def timer(self, stage: str, intent: str = None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, intent)
+
+    def snapshot(self) -> dict:
+        # {stage: {intent: {count, mean_ms, p50_ms, p95_ms, p99_ms}}}
+        result = {}
+        with self._lock:
+            for (stage, intent), histogram in sorted(self._histograms.items()):
+                result.setdefault(stage, {})[intent] = {
+                    "count": histogram.count,
+                    "mean_ms": histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                    **{f"p{int(q * 100)}_ms": histogram.quantile(q) * 1000 for q in QUANTILES},
+                }
+        return result
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        lines = [
+            "# HELP nous_stage_seconds Time spent per message in each processing stage.",
+            "# TYPE nous_stage_seconds histogram",
+        ]
+        quantile_lines = [
+            "# HELP nous_stage_seconds_quantile Estimated latency quantiles per stage and intent.",
+            "# TYPE nous_stage_seconds_quantile gauge",
+        ]
+        with self._lock:
+            for (stage, intent), histogram in sorted(self._histograms.items()):
+                labels = f'stage="{stage}",intent="{intent}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'nous_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"nous_stage_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"nous_stage_seconds_count{{{labels}}} {histogram.count}")
+                for q in QUANTILES:
+                    quantile_lines.append(f'nous_stage_seconds_quantile{{{labels},quantile="{q}"}} {histogram.quantile(q)}')
+            counter_lines = []
+            for (name, labels), value in sorted(self._counters.items()):
+                if not counter_lines or not counter_lines[-1].startswith(f"nous_{name}_total"):
+                    counter_lines.append(f"# TYPE nous_{name}_total counter")
+                labels = ",".join(f'{key}="{label}"' for key, label in labels)
+                counter_lines.append(f"nous_{name}_total{{{labels}}} {value}")
+        return "\n".join(lines + quantile_lines + counter_lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def serve(self, host: str, port: int):
+        # /metrics on a background thread, so scraping never waits on the event loop
+        if self._server is not None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logger.info("Serving metrics on http://%s:%d/metrics", host, self._server.server_address[1])
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+metrics = Metrics()
+
+
+def start_metrics_server():
+    if config.METRICS_PORT > 0:
+        metrics.serve(config.METRICS_HOST, config.METRICS_PORT)
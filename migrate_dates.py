@@ -0,0 +1,93 @@
+import argparse
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from repository import get_database
+from scheduler import partition_for
+from logging_config import logger
+
+# One-off migration: convert reminders whose `date` is still a formatted string into
+# native datetimes, mark reminders created before delivery existed as undelivered (or
+# delivered, if already past) and assign them a delivery partition.
+# Documents are streamed from the cursor and written in batches.
+
+
+def convert_date(value: str, created_at: datetime):
+    value = value.strip()
+    if value.lower() == "today":
+        return created_at
+    if value.lower() == "tomorrow":
+        return created_at + timedelta(days=1)
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def migrate(collection, batch_size: int, dry_run: bool = False):
+    converted = skipped = 0
+    batch = []
+    cursor = collection.find({"date": {"$type": "string"}}, {"date": 1}).batch_size(batch_size)
+    for doc in cursor:
+        # "today"/"tomorrow" are anchored to when the reminder was created
+        created_at = doc["_id"].generation_time.replace(tzinfo=None)
+        date = convert_date(doc["date"], created_at)
+        if date is None:
+            logger.warning("Could not convert date %r of reminder %s", doc['date'], doc['_id'])
+            skipped += 1
+            continue
+        # Matching on the old value keeps the update safe to re-run alongside live writes
+        batch.append(UpdateOne({"_id": doc["_id"], "date": doc["date"]}, {"$set": {"date": date}}))
+        if len(batch) >= batch_size:
+            converted += _flush(collection, batch, dry_run)
+            batch = []
+    if batch:
+        converted += _flush(collection, batch, dry_run)
+    return converted, skipped
+
+
+def assign_partitions(collection, batch_size: int, dry_run: bool = False):
+    # Reminders created before delivery was partitioned get their partition from the user id
+    assigned = 0
+    batch = []
+    cursor = collection.find({"partition": {"$exists": False}}, {"user_id": 1}).batch_size(batch_size)
+    for doc in cursor:
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"partition": partition_for(doc["user_id"])}}))
+        if len(batch) >= batch_size:
+            assigned += _flush(collection, batch, dry_run)
+            batch = []
+    if batch:
+        assigned += _flush(collection, batch, dry_run)
+    return assigned
+
+
+def _flush(collection, batch, dry_run):
+    if dry_run:
+        return len(batch)
+    result = collection.bulk_write(batch, ordered=False)
+    logger.info("Updated %d reminders", result.modified_count)
+    return result.modified_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert string reminder dates to native datetimes")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="count convertible documents without writing")
+    args = parser.parse_args()
+
+    collection = get_database()['reminders']
+    converted, skipped = migrate(collection, args.batch_size, args.dry_run)
+    print(f"Converted: {converted}, skipped: {skipped}")
+    if not args.dry_run:
+        # The delivery scheduler picks up every document with delivered: False, so only reminders
+        # still ahead are backfilled as undelivered; past ones would all be sent at once
+        now = datetime.now()
+        result = collection.update_many({"delivered": {"$exists": False}, "date": {"$gte": now}},
+                                        {"$set": {"delivered": False}})
+        print(f"Marked undelivered: {result.modified_count}")
+        result = collection.update_many({"delivered": {"$exists": False}}, {"$set": {"delivered": True}})
+        print(f"Marked delivered (past or undated): {result.modified_count}")
+    print(f"Assigned partitions: {assign_partitions(collection, args.batch_size, args.dry_run)}")
+
+
+if __name__ == '__main__':
+    main()
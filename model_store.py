@@ -0,0 +1,87 @@
+import argparse
+import os
+import config
+from logging_config import logger
+
+# Exports the models once, in the form the bot loads fastest: the spaCy pipeline without the
+# components no profile uses, and optionally the intent classifier as an (int8 quantized)
+# ONNX model that onnxruntime runs on CPU without TensorFlow. Point MODEL_STORE_DIR at the
+# exported directory to load from it.
+
+SPACY_DIR = "spacy"
+CLASSIFIER_DIR = "classifier"
+ONNX_MODEL = "model.onnx"
+QUANTIZED_MODEL = "model.int8.onnx"
+EXCLUDED_COMPONENTS = ["parser", "senter"]  # no pipeline profile reads the dependency parse
+
+
+def store_path(*parts) -> str:
+    return os.path.join(config.MODEL_STORE_DIR, *parts) if config.MODEL_STORE_DIR else None
+
+
+def export_spacy(name: str, out_dir: str):
+    import spacy
+    nlp = spacy.load(name, exclude=EXCLUDED_COMPONENTS)
+    nlp.to_disk(out_dir)
+    logger.info("Exported spaCy pipeline %s (%s) to %s", name, ", ".join(nlp.pipe_names), out_dir)
+
+
+def export_classifier(name: str, out_dir: str, quantize: bool = True):
+    # Needs tf2onnx for the TensorFlow checkpoint, and onnxruntime to quantize
+    from pathlib import Path
+    from transformers import AutoTokenizer
+    from transformers.onnx import FeaturesManager, export
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    model = FeaturesManager.get_model_from_feature("sequence-classification", name, framework="tf")
+    _, onnx_config_class = FeaturesManager.check_supported_model_or_raise(model, feature="sequence-classification")
+    onnx_config = onnx_config_class(model.config)
+    os.makedirs(out_dir, exist_ok=True)
+    onnx_path = os.path.join(out_dir, ONNX_MODEL)
+    export(tokenizer, model, onnx_config, onnx_config.default_onnx_opset, Path(onnx_path))
+    tokenizer.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, os.path.join(out_dir, QUANTIZED_MODEL), weight_type=QuantType.QInt8)
+    logger.info("Exported classifier %s to %s%s", name, out_dir, " (with int8 weights)" if quantize else "")
+
+
+class OnnxClassifier:
+    # Stands in for the transformers text-classification pipeline: returns [{"label", "score"}]
+    def __init__(self, path: str):
+        import onnxruntime
+        from transformers import AutoConfig, AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.labels = AutoConfig.from_pretrained(path).id2label
+        model_file = os.path.join(path, QUANTIZED_MODEL)
+        if not os.path.exists(model_file):
+            model_file = os.path.join(path, ONNX_MODEL)
+        options = onnxruntime.SessionOptions()
+        # Every NLP worker gets its own session, so don't let each one claim all the cores
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def __call__(self, text: str) -> list:
+        import numpy
+        inputs = self.tokenizer(text, return_tensors="np", truncation=True)
+        logits = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0][0]
+        scores = numpy.exp(logits - logits.max())
+        scores /= scores.sum()
+        best = int(scores.argmax())
+        return [{"label": self.labels[best], "score": float(scores[best])}]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the models to a directory for MODEL_STORE_DIR")
+    parser.add_argument("--out", default=config.MODEL_STORE_DIR or "model_store", help="directory to export to")
+    parser.add_argument("--classifier", action="store_true", help="also export the intent classifier to ONNX")
+    parser.add_argument("--no-quantize", action="store_true", help="keep the classifier's float32 weights")
+    args = parser.parse_args()
+    export_spacy(config.SPACY_MODEL, os.path.join(args.out, SPACY_DIR))
+    if args.classifier:
+        export_classifier(config.CLASSIFIER_MODEL, os.path.join(args.out, CLASSIFIER_DIR), not args.no_quantize)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+import config
+from logging_config import logger
+
+
+def _rss_bytes():
+    # Resident memory of this process, or None when it can't be measured
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux; it is a high-water mark but still shows the load cost
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+class ModelRegistry:
+    # Loads heavy models (and imports their frameworks) only when first requested
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+
+    def register(self, name: str, loader):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str):
+        if name in self._models:
+            return self._models[name]
+        with self._locks[name]:
+            if name not in self._models:
+                self._models[name] = self._load(name)
+        return self._models[name]
+
+    def _load(self, name: str):
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            model = self._loaders[name]()
+        except Exception as e:
+            logger.error("Error loading model '%s': %s", name, e)
+            self._stats[name] = {"loaded": False, "error": str(e)}
+            return None
+        load_seconds = time.perf_counter() - start
+        rss_after = _rss_bytes()
+        memory_bytes = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        self._stats[name] = {"loaded": True, "load_seconds": load_seconds, "memory_bytes": memory_bytes}
+        logger.info("Model '%s' loaded in %.2fs, memory delta: %s bytes", name, load_seconds, memory_bytes)
+        return model
+
+    def warm_up(self, names=None, background: bool = True):
+        names = list(names) if names is not None else list(self._loaders)
+
+        def load_all():
+            for name in names:
+                if name in self._loaders:
+                    self.get(name)
+                else:
+                    logger.error("Unknown model '%s' requested for warm-up", name)
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="model-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> dict:
+        return {name: dict(stat) for name, stat in self._stats.items()}
+
+
+def _load_spacy():
+    import spacy
+    from model_store import SPACY_DIR, store_path
+    path = store_path(SPACY_DIR)
+    return spacy.load(path if path and os.path.isdir(path) else config.SPACY_MODEL)
+
+
+def _load_classifier():
+    if config.CLASSIFIER_RUNTIME == "onnx":
+        from model_store import CLASSIFIER_DIR, OnnxClassifier, store_path
+        return OnnxClassifier(store_path(CLASSIFIER_DIR))
+    from transformers import pipeline
+    return pipeline("text-classification", model=config.CLASSIFIER_MODEL, framework="tf")
+
+
+registry = ModelRegistry()
+registry.register("spacy", _load_spacy)
+registry.register("classifier", _load_classifier)
+
+
+def get_nlp():
+    return registry.get("spacy")
+
+
+def get_classifier():
+    return registry.get("classifier")
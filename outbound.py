@@ -0,0 +1,240 @@
+import asyncio
+import time
+from collections import deque
+from telegram.error import RetryAfter
+import config
+from logging_config import logger
+from metrics import metrics
+
+INTERACTIVE = 0  # replies to the user's own messages
+SCHEDULED = 1  # reminder deliveries
+MAX_MESSAGE_LENGTH = 4096
+BUCKET_SWEEP_SECONDS = 60  # how often per-chat buckets that are full again are dropped
+# A 429 doesn't say which limit was hit; retry_after for this many chats at once is taken as the global one
+GLOBAL_RETRY_CHATS = 2
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        # Seconds until a token is available, 0 if one is available now
+        self._refill(now)
+        return max(self.blocked_until - now, 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate)
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+    def block(self, until: float):
+        # Telegram's retry_after: no tokens until then
+        self.blocked_until = max(self.blocked_until, until)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class OutboundMessage:
+    def __init__(self, chat_id: int, text: str, priority: int, kwargs: dict):
+        self.chat_id = chat_id
+        self.text = text
+        self.priority = priority
+        self.kwargs = kwargs
+        self.futures = [asyncio.get_running_loop().create_future()]
+        self.enqueued = time.monotonic()
+
+
+class OutboundQueue:
+    # Single sender for everything the bot posts. A global token bucket and one bucket per
+    # chat keep sends under Telegram's limits; interactive replies always go before
+    # scheduled deliveries; a 429's retry_after pauses that chat (or everything, when
+    # several chats get one); and scheduled deliveries still waiting for the same chat are
+    # merged into one message. Sends run concurrently, at most one per chat so each
+    # chat's messages arrive in order.
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: float):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._chat_buckets = {}
+        # Per lane: chat ids in arrival order, and each chat's pending messages
+        self._lanes = [deque(), deque()]
+        self._pending = [{}, {}]
+        self._bot = None
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self._in_flight = set()
+        self._tasks = set()
+        self._swept_at = time.monotonic()
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    def start(self, bot):
+        self._bot = bot
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(self._task, *self._tasks, return_exceptions=True)
+            self._task = None
+
+    async def send(self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs):
+        # Resolves with the sent Message once this text has gone out; the time until then,
+        # queueing included, is the "send" stage (deliveries are counted under "delivery")
+        with metrics.timer("send", "delivery" if priority == SCHEDULED else None):
+            return await self._send(chat_id, text, priority, kwargs)
+
+    async def _send(self, chat_id: int, text: str, priority: int, kwargs: dict):
+        pending = self._pending[priority].get(chat_id)
+        if priority == SCHEDULED and pending and not kwargs and not pending[-1].kwargs \
+                and len(pending[-1].text) + len(text) + 1 <= MAX_MESSAGE_LENGTH:
+            message = pending[-1]
+            message.text += "\n" + text
+            future = asyncio.get_running_loop().create_future()
+            message.futures.append(future)
+            self.coalesced += 1
+            return await future
+
+        message = OutboundMessage(chat_id, text, priority, kwargs)
+        if pending is None:
+            pending = self._pending[priority][chat_id] = deque()
+            self._lanes[priority].append(chat_id)
+        pending.append(message)
+        self._wakeup.set()
+        return await message.futures[0]
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _sweep_buckets(self, now: float):
+        # A full bucket is the same as a new one, so idle chats don't need to keep theirs
+        self._swept_at = now
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_full(now)]:
+            if chat_id not in self._in_flight and not any(chat_id in pending for pending in self._pending):
+                del self._chat_buckets[chat_id]
+
+    def _next_message(self, now: float):
+        # The first message, highest priority lane first, whose chat has a token and no send
+        # in flight; otherwise how long until a token is available (None: wait for a send to finish)
+        wait = None
+        for priority, lane in enumerate(self._lanes):
+            for chat_id in lane:
+                if chat_id in self._in_flight:
+                    continue
+                chat_wait = self._chat_bucket(chat_id).wait_time(now)
+                if chat_wait == 0:
+                    return self._pop(priority, chat_id), 0.0
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+        return None, wait
+
+    def _pop(self, priority: int, chat_id: int) -> OutboundMessage:
+        pending = self._pending[priority][chat_id]
+        message = pending.popleft()
+        if not pending:
+            del self._pending[priority][chat_id]
+            self._lanes[priority].remove(chat_id)
+        return message
+
+    def _requeue(self, message: OutboundMessage):
+        pending = self._pending[message.priority].get(message.chat_id)
+        if pending is None:
+            pending = self._pending[message.priority][message.chat_id] = deque()
+            self._lanes[message.priority].appendleft(message.chat_id)
+        pending.appendleft(message)
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            if now - self._swept_at >= BUCKET_SWEEP_SECONDS:
+                self._sweep_buckets(now)
+            wait = max(self._paused_until - now, self.global_bucket.wait_time(now))
+            message = None
+            if wait <= 0:
+                message, wait = self._next_message(now)
+            if message is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.global_bucket.take(now)
+            self._chat_bucket(message.chat_id).take(now)
+            self._in_flight.add(message.chat_id)
+            task = asyncio.create_task(self._deliver(message))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, message: OutboundMessage):
+        try:
+            sent = await self._bot.send_message(chat_id=message.chat_id, text=message.text, **message.kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            self.retries += 1
+            now = time.monotonic()
+            blocked = sum(1 for chat_id, bucket in self._chat_buckets.items()
+                          if chat_id != message.chat_id and bucket.blocked_until > now)
+            if blocked + 1 >= GLOBAL_RETRY_CHATS:
+                logger.warning("Telegram asked to retry after %ss, pausing all chats", retry_after)
+                self._paused_until = max(self._paused_until, now + retry_after)
+            else:
+                logger.warning("Telegram asked to retry after %ss for chat %s", retry_after, message.chat_id)
+            self._chat_bucket(message.chat_id).block(now + retry_after)
+            self._requeue(message)
+            return
+        except Exception as e:
+            for future in message.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._in_flight.discard(message.chat_id)
+            self._wakeup.set()
+        self.sent += 1
+        for future in message.futures:
+            if not future.done():
+                future.set_result(sent)
+
+    def stats(self) -> dict:
+        return {
+            "queued": [sum(len(pending) for pending in lane.values()) for lane in self._pending],
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "chat_buckets": len(self._chat_buckets),
+        }
+
+
+outbound = OutboundQueue(config.OUTBOUND_GLOBAL_RATE, config.OUTBOUND_CHAT_RATE, config.OUTBOUND_CHAT_BURST)
+
+
+async def reply(message, text: str, **kwargs):
+    # Reply in the message's chat through the outbound queue; straight through the
+    # message when the queue isn't running (e.g. benchmarks with mocked updates)
+    if not outbound.started:
+        with metrics.timer("send"):
+            return await message.reply_text(text, **kwargs)
+    return await outbound.send(message.chat_id, text, INTERACTIVE, **kwargs)
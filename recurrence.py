@@ -0,0 +1,195 @@
+import re
+from datetime import datetime, timedelta
+from dateutil.rrule import rrulestr
+from timeparse import PARTS_OF_DAY, WEEKDAYS, NUMBER_WORDS, date_from_parts
+
+# Recurring reminders are stored as one document: an RFC 5545 rule in `recurrence` and the
+# next occurrence in `date`. Occurrences are only ever computed one at a time, from the
+# current one, when it is delivered or shown; none are stored ahead.
+
+DAY_CODES = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+FREQUENCIES = {"minute": "MINUTELY", "hour": "HOURLY", "day": "DAILY", "week": "WEEKLY", "month": "MONTHLY",
+               "year": "YEARLY"}
+ADVERBS = {"hourly": "HOURLY", "daily": "DAILY", "nightly": "DAILY", "weekly": "WEEKLY", "monthly": "MONTHLY",
+           "yearly": "YEARLY", "annually": "YEARLY"}
+DEFAULT_TIME = PARTS_OF_DAY["morning"]  # for day-or-longer rules given without a time
+WEEKDAY_PATTERN = "|".join(WEEKDAYS)
+MAX_MINUTELY_INTERVAL = 5  # "every minute" would flood the outbound queue
+
+# A bare "daily"/"weekly" only recurs when it ends the clause or is followed by a time or
+# date phrase ("take pills daily at 9"); before a noun it is an adjective ("the weekly
+# groceries tomorrow") and the one-off grammar decides
+ADVERB_FOLLOWERS = r"\s*(?:$|[.,;:!?)]|(?:at|on|in|from|starting|until|till|before|after|and|or|please)\b)"
+
+RECURRENCE_GRAMMAR = re.compile(r"""
+    \b(?:
+        (?P<every>every|each)\s+(?:
+            (?P<interval>\d+|""" + "|".join(NUMBER_WORDS) + r""")\s+(?P<units>minute|hour|day|week|month|year)s
+          | (?P<weekdays>weekday|weekend)s?
+          | (?P<days>(?:""" + WEEKDAY_PATTERN + r""")s?(?:(?:\s*,\s*|\s+and\s+|\s*,\s*and\s+)(?:""" + WEEKDAY_PATTERN + r""")s?)*)
+          | (?P<part>""" + "|".join(PARTS_OF_DAY) + r""")
+          | (?P<other>other\s+)?(?P<unit>minute|hour|day|week|month|year)
+        )
+      | (?P<adverb>""" + "|".join(ADVERBS) + r""")(?=""" + ADVERB_FOLLOWERS + r""")
+      | on\s+(?P<plural_weekdays>weekday|weekend)s
+      | on\s+(?P<plural_days>(?:""" + WEEKDAY_PATTERN + r""")s)
+    )(?!\w)
+""", re.IGNORECASE | re.VERBOSE)
+
+# Which days an interval rule falls on: "every 2 weeks on friday", "every month on the 5th"
+ON_DAYS = re.compile(r"\bon\s+(?:(?:" + WEEKDAY_PATTERN + r")s?(?:\s*,\s*and\s+|\s*,\s*|\s+and\s+)?)+", re.IGNORECASE)
+ON_MONTH_DAY = re.compile(r"\bon\s+the\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?\b", re.IGNORECASE)
+# A part of day right after the days: "every monday evening", "on weekdays in the morning"
+PART_AFTER_DAYS = re.compile(r"\s+(?:in\s+the\s+)?(?P<part>" + "|".join(PARTS_OF_DAY) + r")s?(?!\w)", re.IGNORECASE)
+# A numeric date anchors yearly and monthly rules: "every year on 12/03/2026"
+ON_DATE = re.compile(r"\b(?:on\s+)?(?P<first>\d{1,2})/(?P<second>\d{1,2})/(?P<year>\d{4}|\d{2})(?!\w)", re.IGNORECASE)
+
+# Times of day that go with a recurrence; unlike one-off reminders a bare "at 9" is accepted
+TIME_OF_DAY = re.compile(r"\b(?:at\s+)(?P<hour>\d{1,2})(?:[:.](?P<minute>\d{2}))?(?:\s*(?P<meridiem>[ap])\.?m\.?)?(?!\w)"
+                         r"|\b(?P<hour12>\d{1,2})(?:[:.](?P<minute12>\d{2}))?\s*(?P<meridiem12>[ap])\.?m\.?(?!\w)"
+                         r"|\b(?:at\s+)?(?P<noon>noon|midnight)\b", re.IGNORECASE)
+
+
+class RecurrenceMatch:
+    def __init__(self, rule: str, first: datetime, spans: list):
+        self.rule = rule
+        self.first = first
+        self.spans = spans
+
+
+def _day_codes(text: str) -> list:
+    names = re.findall(WEEKDAY_PATTERN, text, re.IGNORECASE)
+    return sorted({DAY_CODES[WEEKDAYS.index(name.lower())] for name in names}, key=DAY_CODES.index)
+
+
+def _time_of_day(text: str, spans: list):
+    for match in TIME_OF_DAY.finditer(text):
+        groups = match.groupdict()
+        if groups["noon"]:
+            hour, minute, meridiem = (12 if groups["noon"].lower() == "noon" else 0), 0, None
+        elif groups["hour12"]:
+            hour, minute, meridiem = int(groups["hour12"]), int(groups["minute12"] or 0), groups["meridiem12"]
+        else:
+            hour, minute, meridiem = int(groups["hour"]), int(groups["minute"] or 0), groups["meridiem"]
+        if meridiem:
+            if not 1 <= hour <= 12:
+                continue
+            hour = hour % 12 + (12 if meridiem.lower() == "p" else 0)
+        if hour > 23 or minute > 59:
+            continue
+        spans.append(match.span())
+        return hour, minute
+    return None
+
+
+def parse_recurrence(text: str, now: datetime = None):
+    # "every weekday at 9", "every 2 weeks", "on mondays and thursdays at 6pm", "daily"...
+    # Returns a RecurrenceMatch, or None when the message doesn't recur
+    match = RECURRENCE_GRAMMAR.search(text)
+    if match is None:
+        return None
+    now = (now or datetime.now()).replace(second=0, microsecond=0)
+    groups = match.groupdict()
+    spans = [match.span()]
+    parts = []
+    time = None
+    interval = 1
+
+    if groups["interval"]:
+        amount = groups["interval"].lower()
+        interval = int(amount) if amount.isdigit() else NUMBER_WORDS[amount]
+        frequency = FREQUENCIES[groups["units"].lower()]
+    elif groups["weekdays"] or groups["plural_weekdays"]:
+        kind = (groups["weekdays"] or groups["plural_weekdays"]).lower()
+        frequency = "WEEKLY"
+        parts.append("BYDAY=" + ",".join(DAY_CODES[:5] if kind == "weekday" else DAY_CODES[5:]))
+    elif groups["days"] or groups["plural_days"]:
+        frequency = "WEEKLY"
+        parts.append("BYDAY=" + ",".join(_day_codes(groups["days"] or groups["plural_days"])))
+    elif groups["part"]:
+        frequency = "DAILY"
+        time = PARTS_OF_DAY[groups["part"].lower()]
+    elif groups["unit"]:
+        frequency = FREQUENCIES[groups["unit"].lower()]
+        if groups["other"]:
+            interval = 2
+    else:
+        frequency = ADVERBS[groups["adverb"].lower()]
+        if groups["adverb"].lower() == "nightly":
+            time = PARTS_OF_DAY["night"]
+    if time is None and frequency in ("DAILY", "WEEKLY"):
+        part_after = PART_AFTER_DAYS.match(text, match.end())
+        if part_after:
+            time = PARTS_OF_DAY[part_after.group("part").lower()]
+            spans.append(part_after.span())
+
+    if frequency == "WEEKLY" and not parts:
+        on_days = ON_DAYS.search(text, match.end())
+        if on_days:
+            parts.append("BYDAY=" + ",".join(_day_codes(on_days.group())))
+            spans.append(on_days.span())
+    elif frequency == "MONTHLY":
+        on_day = ON_MONTH_DAY.search(text)
+        if on_day and 1 <= int(on_day.group("day")) <= 31:
+            parts.append(f"BYMONTHDAY={int(on_day.group('day'))}")
+            spans.append(on_day.span())
+    start = None
+    if frequency in ("MONTHLY", "YEARLY"):
+        on_date = ON_DATE.search(text)
+        date = on_date and date_from_parts(int(on_date.group("first")), int(on_date.group("second")),
+                                            int(on_date.group("year")))
+        if date:
+            if frequency == "YEARLY":
+                parts.append(f"BYMONTH={date.month}")
+            if not any(part.startswith("BYMONTHDAY=") for part in parts):
+                parts.append(f"BYMONTHDAY={date.day}")
+            start = date
+            spans.append(on_date.span())
+    if frequency == "MINUTELY":
+        interval = max(interval, MAX_MINUTELY_INTERVAL)
+    time = _time_of_day(text, spans) or time
+    if frequency not in ("HOURLY", "MINUTELY"):
+        hour, minute = time or DEFAULT_TIME
+        parts += [f"BYHOUR={hour}", f"BYMINUTE={minute}", "BYSECOND=0"]
+    rule = ";".join([f"FREQ={frequency}"] + parts)
+    interval_rule = rule.replace(f"FREQ={frequency}", f"FREQ={frequency};INTERVAL={interval}")
+    # An explicit date still ahead is the first occurrence itself
+    if start is not None and start.replace(hour=hour, minute=minute) > now:
+        now = start.replace(hour=hour, minute=minute) - timedelta(minutes=1)
+    # "every 2 hours" first fires two hours from now; day-or-longer rules first fire on the next
+    # matching day and count their interval from there
+    first = next_occurrence(interval_rule if frequency in ("HOURLY", "MINUTELY") else rule, now)
+    if interval > 1 or frequency in ("HOURLY", "MINUTELY"):
+        rule = interval_rule
+    if first is None:
+        return None
+    return RecurrenceMatch(rule, first, sorted(spans))
+
+
+def next_occurrence(rule: str, current: datetime, after: datetime = None):
+    # The first occurrence after `after` (default: `current`), counting intervals from the
+    # current one, or None if the rule has ended. Occurrences missed while nothing was
+    # running collapse into the next one.
+    return rrulestr(rule, dtstart=current).after(max(current, after or current))
+
+
+def describe(rule: str) -> str:
+    fields = dict(part.split("=", 1) for part in rule.split(";"))
+    interval = int(fields.get("INTERVAL", 1))
+    unit = {value: key for key, value in FREQUENCIES.items()}[fields["FREQ"]]
+    days = fields.get("BYDAY", "").split(",") if fields.get("BYDAY") else []
+    if days == DAY_CODES[:5]:
+        text = "every weekday"
+    elif days == DAY_CODES[5:]:
+        text = "every weekend day"
+    elif days:
+        names = [WEEKDAYS[DAY_CODES.index(day)].capitalize() for day in days]
+        names = names[0] if len(names) == 1 else ", ".join(names[:-1]) + " and " + names[-1]
+        text = f"every {interval} weeks on {names}" if interval > 1 else f"every {names}"
+    else:
+        text = f"every {interval} {unit}s" if interval > 1 else f"every {unit}"
+        if "BYMONTHDAY" in fields:
+            text += f" on day {fields['BYMONTHDAY']}"
+    if "BYHOUR" in fields:
+        text += f" at {int(fields['BYHOUR']):02d}:{int(fields.get('BYMINUTE', 0)):02d}"
+    return text
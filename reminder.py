@@ -1,21 +1,75 @@
-import re, dateparser, spacy
-from datetime import datetime, timedelta
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
 from spacy import Language
 from spacy.matcher import Matcher
+from spacy.tokens import Doc
 from logging_config import logger
+from analysis import MessageAnalysis
+from timeparse import parse_time_phrases, parse_with_dateparser
+from recurrence import parse_recurrence, describe
+
+# Time phrases stripped from the reminder text when the fast path didn't supply their spans
+TIME_PHRASE_PATTERNS = [re.compile(phrase, re.IGNORECASE) for phrase in [
+    r'\b(at\s*)?\d{1,2}[:.]\d{2}\s*(am|pm)?',
+    r'\b(at\s*)?\d{1,2}\s*(am|pm)',
+    r'\b\d{1,2}[:.]\d{2}\s*(am|pm)?|\d{1,2}\s*(am|pm)',
+    r'\b(morning|afternoon|evening|night|tomorrow|today)\b',
+    r'\bon\s*\b\d{1,2}/\d{1,2}/\d{2,4}\b'
+]]
+
+
+@lru_cache(maxsize=8)
+def verb_noun_matcher(vocab) -> Matcher:
+    # Built once per vocab instead of on every clean_message call
+    matcher = Matcher(vocab)
+    matcher.add("VERB_NOUN_PATTERN", [[{"POS": "VERB"}, {"POS": "NOUN", "OP": "+"}]])
+    return matcher
+
+
+def fast_path_date(message: str, now: datetime = None):
+    # Recurring phrasings ("every weekday at 9") keep their rule and start at the first
+    # occurrence; then the compiled grammar for common one-off phrasings.
+    # Returns (date, recurrence, spans), or None when neither grammar matches.
+    recurring = parse_recurrence(message, now)
+    if recurring:
+        return recurring.first, recurring.rule, recurring.spans
+    match = parse_time_phrases(message, now)
+    if match:
+        return match.date, None, match.spans
+    return None
+
+
+def format_reminder_text(cleaned_message: str, parsed_date, recurrence: str = None) -> str:
+    # Format the date for display purposes
+    if isinstance(parsed_date, datetime):
+        # Format example: "29 Aug 2024 00:00"
+        date_str = parsed_date.strftime('%d %b %Y %H:%M')
+    else:
+        date_str = parsed_date  # In case parsed_date is a string
+
+    if recurrence:
+        return f"Reminder set: '{cleaned_message}' {describe(recurrence)}, starting {date_str}"
+    return f"Reminder set: '{cleaned_message}' scheduled for {date_str}"
 
 
 class Reminder:
-    def __init__(self, user_id: int, message: str, nlp: Language):
+    def __init__(self, user_id: int, message: str, nlp: Language = None, analysis: MessageAnalysis = None):
         self.user_id = user_id
-        self.original_message = message
-        # Check if nlp is provided, otherwise load the SpaCy model
-        if nlp is None:
-            self.nlp = spacy.load("en_core_web_sm")
-        else:
-            self.nlp = nlp
+        # Reuse the update's analysis context so the message is parsed only once
+        if analysis is None:
+            analysis = MessageAnalysis(message, nlp)
+        self.analysis = analysis
+        self.original_message = analysis.text
+        self.nlp = analysis.nlp
         self.cleaned_message = ""
         self.parsed_date = None
+        self.time_spans = None
+        self.recurrence = None
+        # Which parser found the date: grammar, dateparser or entities
+        self.date_source = None
+        self.timings = {}
         self.process_message()
 
     def process_message(self):
@@ -23,47 +77,64 @@ class Reminder:
         self.cleaned_message = self.clean_message(self.original_message)
 
     def extract_datetime(self, message: str):
-        # First, attempt to parse with dateparser
-        parsed_date = dateparser.parse(message, settings={'PREFER_DATES_FROM': 'future'})
+        self.time_spans = None
+        self.recurrence = None
+        self.date_source = None
+        # First, try the compiled grammars; they also record the phrase spans
+        fast = fast_path_date(message)
+        if fast:
+            self.date_source = "grammar"
+            parsed_date, self.recurrence, self.time_spans = fast
+            return parsed_date
+
+        # Then fall back to dateparser with a restricted English profile
+        parsed_date = self._dateparser(message)
         
         if parsed_date:
+            self.date_source = "dateparser"
             return parsed_date
 
-        # If dateparser fails, try using spaCy to extract date/time entities
-        doc = self.nlp(message)
-        for ent in doc.ents:
-            if ent.label_ in ["TIME", "DATE"]:
-                try:
-                    return datetime.strptime(ent.text, "%Y-%m-%d %H:%M:%S")
-                except ValueError:
-                    if ent.text.lower() == "tomorrow":
-                        return datetime.now() + timedelta(days=1)
-                    elif ent.text.lower() == "today":
-                        return datetime.now()
-                    return ent.text
+        # If dateparser fails, resolve the spaCy date/time entities from the shared parse
+        for label, start, end, text in self.analysis.entities:
+            if label in ["TIME", "DATE"]:
+                parsed_date = self._dateparser(text)
+                if parsed_date:
+                    self.time_spans = [(start, end)]
+                    self.date_source = "entities"
+                    return parsed_date
 
         return None
 
+    def _dateparser(self, text: str):
+        start = time.perf_counter()
+        try:
+            return parse_with_dateparser(text)
+        finally:
+            self.timings["dateparser"] = self.timings.get("dateparser", 0.0) + time.perf_counter() - start
+
     def clean_message(self, message: str):
-        phrases_to_remove = [
-            r'\b(at\s*)?\d{1,2}[:.]\d{2}\s*(am|pm)?',
-            r'\b(at\s*)?\d{1,2}\s*(am|pm)',
-            r'\b\d{1,2}[:.]\d{2}\s*(am|pm)?|\d{1,2}\s*(am|pm)',
-            r'\b(morning|afternoon|evening|night|tomorrow|today)\b',
-            r'\bon\s*\b\d{1,2}/\d{1,2}/\d{2,4}\b'
-        ]
-
-        cleaned_message = message
-        for phrase in phrases_to_remove:
-            cleaned_message = re.sub(phrase, '', cleaned_message, flags=re.IGNORECASE)
-
-        doc = self.nlp(cleaned_message)
+        # Reuse the spans found while extracting the date, otherwise collect the character
+        # spans of time phrases instead of rewriting the text
+        if self.time_spans is not None:
+            removed_spans = self.time_spans
+        else:
+            removed_spans = []
+            for pattern in TIME_PHRASE_PATTERNS:
+                removed_spans.extend(match.span() for match in pattern.finditer(message))
+
+        # Build a Doc of the remaining tokens, carrying over their POS tags from the shared parse
+        tokens = self.analysis.tokens_outside(removed_spans)
+        if not tokens:
+            return ""
+        doc = Doc(
+            self.nlp.vocab,
+            words=[token.text for token in tokens],
+            spaces=[bool(token.whitespace_) for token in tokens],
+            pos=[token.pos_ for token in tokens],
+        )
         
         # Rule-based matching
-        matcher = Matcher(self.nlp.vocab)
-        pattern = [{"POS": "VERB"}, {"POS": "NOUN", "OP": "+"}]
-        matcher.add("VERB_NOUN_PATTERN", [pattern])
-        matches = matcher(doc)
+        matches = verb_noun_matcher(self.nlp.vocab)(doc)
         
         if matches:
             match_id, start, end = matches[0]
@@ -76,12 +147,4 @@ class Reminder:
         return " ".join(relevant_tokens).strip()
 
     def get_reminder_text(self):
-        # Format the date for display purposes
-        if isinstance(self.parsed_date, datetime):
-            # Format example: "29 Aug 2024 00:00"
-            date_str = self.parsed_date.strftime('%d %b %Y %H:%M')
-        else:
-            date_str = self.parsed_date  # In case parsed_date is a string
-
-        return f"Reminder set: '{self.cleaned_message}' scheduled for {date_str}"
-
+        return format_reminder_text(self.cleaned_message, self.parsed_date, self.recurrence)
@@ -0,0 +1,383 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import uuid
+from collections import Counter
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, DeleteOne, InsertOne, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+import config
+from batching import MicroBatcher
+from cache import ReminderCache
+from fuzzy_index import reminder_index
+from logging_config import logger
+from metrics import metrics
+from recurrence import next_occurrence
+
+_client = None
+_client_lock = threading.Lock()
+
+# Fields the listing and matching paths need; recurrence lets them describe repeating reminders
+SUMMARY_FIELDS = {"reminder": 1, "date": 1, "recurrence": 1}
+
+
+def get_client():
+    # Create the MongoClient on first use instead of at import time
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None and (config.MONGO_URI or '').startswith('mongomock://'):
+                # In-memory MongoDB for local runs without a mongod; shared by this process only
+                import mongomock
+                _client = mongomock.MongoClient()
+            elif _client is None:
+                _client = MongoClient(
+                    config.MONGO_URI,
+                    maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=config.MONGO_MIN_POOL_SIZE,
+                    serverSelectionTimeoutMS=config.MONGO_TIMEOUT_MS,
+                    connectTimeoutMS=config.MONGO_CONNECT_TIMEOUT_MS,
+                    socketTimeoutMS=config.MONGO_TIMEOUT_MS,
+                    waitQueueTimeoutMS=config.MONGO_TIMEOUT_MS,
+                )
+                logger.debug("MongoDB client created.")
+    return _client
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def get_database():
+    return get_client()[config.MONGO_DB_NAME]
+
+
+def after_clause(after: tuple) -> dict:
+    # Keyset condition for documents sorted by (date, _id) that come after `after`
+    date, last_id = after
+    return {"$or": [{"date": {"$gt": date}}, {"date": date, "_id": {"$gt": last_id}}]}
+
+
+class ReminderRepository:
+    # Async facade over the reminders collection. pymongo is blocking, so every call
+    # runs on a bounded thread pool and handlers never stall the event loop.
+    def __init__(self, collection=None, max_workers: int = None, write_buffer: bool = None, cache: bool = None):
+        self._collection = collection
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.MONGO_EXECUTOR_WORKERS,
+            thread_name_prefix="mongo",
+        )
+        # Write-behind buffer: inserts and deletes from concurrent handlers are coalesced
+        # into one unordered bulk_write, flushed on size or after a short delay. Flushes run
+        # on the same executor, so its limit covers all Mongo work.
+        write_buffer = config.WRITE_BUFFER_ENABLED if write_buffer is None else write_buffer
+        self._write_buffer = MicroBatcher(
+            self._bulk_write, config.WRITE_BUFFER_FLUSH_MS, config.WRITE_BUFFER_MAX_BATCH, self._executor
+        ) if write_buffer else None
+        cache = config.CACHE_ENABLED if cache is None else cache
+        self.cache = ReminderCache(
+            config.CACHE_MAX_BYTES, config.CACHE_TTL_SECONDS, config.CACHE_REVALIDATE_SECONDS, config.CACHE_MAX_REMINDERS
+        ) if cache else None
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_database()['reminders']
+        return self._collection
+
+    @property
+    def versions(self):
+        # {_id: user_id, v: token}; every write sets a new token for the users it touched
+        return self.collection.database['reminder_versions']
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        with metrics.timer("mongo"):
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def ensure_indexes(self):
+        # Per-user lookups come back sorted by (date, _id) straight from this index, so a page
+        # is read in index order instead of sorting all of the user's reminders
+        await self._run(self.collection.create_index, [("user_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)])
+        # Its (user_id, date) prefix made the older index redundant
+        if "user_id_1_date_1" in await self._run(self.collection.index_information):
+            await self._run(self.collection.drop_index, "user_id_1_date_1")
+        # Due-time index each delivery partition's scheduler refills from
+        await self._run(self.collection.create_index, [
+            ("partition", ASCENDING), ("delivered", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)
+        ])
+
+    def _bump_versions(self, user_ids: list) -> list:
+        # Increments each user's version once per write and returns the version each write
+        # produced, in order (None if it couldn't be stored). A cache entry can apply a
+        # write-through only if it holds exactly the version before that write.
+        counts = Counter(user_id for user_id in user_ids if user_id is not None)
+        if not counts:
+            return [None] * len(user_ids)
+        try:
+            self.versions.bulk_write(
+                [UpdateOne({"_id": user_id}, {"$inc": {"v": count}}, upsert=True) for user_id, count in counts.items()],
+                ordered=False,
+            )
+            current = {doc["_id"]: doc["v"] for doc in self.versions.find({"_id": {"$in": list(counts)}})}
+        except Exception as e:
+            logger.error("Error updating reminder versions: %s", e)
+            return [None] * len(user_ids)
+        seen = Counter()
+        versions = []
+        for user_id in user_ids:
+            if user_id is None or user_id not in current:
+                versions.append(None)
+                continue
+            seen[user_id] += 1
+            versions.append(current[user_id] - counts[user_id] + seen[user_id])
+        return versions
+
+    def _read_version(self, user_id: int) -> int:
+        doc = self.versions.find_one({"_id": user_id}, {"v": 1})
+        return doc["v"] if doc else 0
+
+    def _bulk_write(self, writes: list) -> list:
+        # writes are (operation, user_id) pairs; returns (error, version) per write,
+        # error being None if it was written
+        operations = [operation for operation, _ in writes]
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+            errors = [None] * len(operations)
+        except BulkWriteError as e:
+            if e.details.get("writeConcernErrors"):
+                return [(e, None)] * len(operations)
+            errors = [None] * len(operations)
+            for error in e.details.get("writeErrors", []):
+                errors[error["index"]] = BulkWriteError({"writeErrors": [error]})
+        versions = self._bump_versions([user_id if error is None else None for (_, user_id), error in zip(writes, errors)])
+        return list(zip(errors, versions))
+
+    async def _write(self, operation, user_id: int = None):
+        # Resolves once the batch holding the operation is acknowledged; raises if it failed.
+        # Returns the user's version after the write.
+        if self._write_buffer is None:
+            error, version = (await self._run(self._bulk_write, [(operation, user_id)]))[0]
+        else:
+            with metrics.timer("mongo"):
+                error, version = await self._write_buffer.submit((operation, user_id))
+        if error is not None:
+            raise error
+        return version
+
+    def write_buffer_stats(self) -> dict:
+        return self._write_buffer.stats() if self._write_buffer is not None else {}
+
+    async def insert(self, reminder_doc: dict):
+        reminder_doc.setdefault("_id", ObjectId())
+        # BSON keeps milliseconds; truncate here so the cache, the scheduler and page tokens
+        # hold the same date as the stored document
+        if isinstance(reminder_doc.get("date"), datetime):
+            date = reminder_doc["date"]
+            reminder_doc["date"] = date.replace(microsecond=date.microsecond // 1000 * 1000)
+        version = await self._write(InsertOne(reminder_doc), reminder_doc["user_id"])
+        if self.cache is not None:
+            self.cache.add(reminder_doc["user_id"], reminder_doc, version)
+        reminder_index.add(reminder_doc["user_id"], reminder_doc["_id"], reminder_doc["reminder"], version)
+        return reminder_doc["_id"]
+
+    async def _cached_reminders(self, user_id: int):
+        # The user's pending reminders from the cache, loading them on a miss;
+        # None if the cache is off or the user has too many reminders to cache
+        if self.cache is None or self.cache.is_oversized(user_id):
+            return None
+        entry = self.cache.get(user_id)
+        if entry is not None:
+            if not self.cache.needs_revalidation(entry):
+                self.cache.record_hit()
+                return entry.reminders
+            if await self._run(self._read_version, user_id) == entry.version:
+                self.cache.mark_checked(entry)
+                self.cache.record_hit()
+                return entry.reminders
+            self.cache.invalidate(user_id)
+        self.cache.record_miss()
+
+        def load():
+            # Version first: a write landing in between leaves a stale version and forces a reload later
+            version = self._read_version(user_id)
+            cursor = self.collection.find({"user_id": user_id, "delivered": {"$ne": True}}, SUMMARY_FIELDS) \
+                .sort([("date", ASCENDING), ("_id", ASCENDING)]).limit(self.cache.max_reminders + 1)
+            return version, list(cursor)
+
+        version, docs = await self._run(load)
+        if len(docs) > self.cache.max_reminders:
+            self.cache.mark_oversized(user_id)
+            return None
+        self.cache.put(user_id, docs, version)
+        return docs
+
+    async def version_of(self, user_id: int):
+        # The user's version token, from the cache while its entry is trusted
+        if self.cache is not None:
+            entry = self.cache.get(user_id)
+            if entry is not None and not self.cache.needs_revalidation(entry):
+                return entry.version
+        return await self._run(self._read_version, user_id)
+
+    async def find_by_user(self, user_id: int) -> list:
+        cached = await self._cached_reminders(user_id)
+        if cached is not None:
+            return list(cached)
+        return await self._run(lambda: list(
+            self.collection.find({"user_id": user_id, "delivered": {"$ne": True}}, SUMMARY_FIELDS)
+            .sort([("date", ASCENDING), ("_id", ASCENDING)])
+        ))
+
+    async def find_page(self, user_id: int, after: tuple = None, limit: int = 20):
+        # Keyset pagination over the (user_id, date, _id) index: `after` is the (date, _id) of the
+        # last reminder on the previous page. Returns the page and whether more follow.
+        cached = await self._cached_reminders(user_id)
+        if cached is not None:
+            start = 0
+            if after is not None:
+                start = next((i for i, reminder in enumerate(cached)
+                              if isinstance(reminder["date"], datetime) and (reminder["date"], reminder["_id"]) > after),
+                             len(cached))
+            page = cached[start:start + limit + 1]
+            return page[:limit], len(page) > limit
+
+        query = {"user_id": user_id, "delivered": {"$ne": True}}
+        if after is not None:
+            query.update(after_clause(after))
+
+        def fetch():
+            cursor = self.collection.find(query, SUMMARY_FIELDS) \
+                .sort([("date", ASCENDING), ("_id", ASCENDING)]).limit(limit + 1)
+            return list(cursor)
+
+        page = await self._run(fetch)
+        return page[:limit], len(page) > limit
+
+    async def find_due(self, before: datetime, limit: int = 1000, partition: int = None,
+                       inserted_since: datetime = None) -> list:
+        # Undelivered reminders due before `before`, in due order; with inserted_since, only
+        # those created since then (ObjectIds carry their creation time)
+        query = {"delivered": False, "date": {"$lt": before}}
+        if partition is not None:
+            query["partition"] = partition
+        if inserted_since is not None:
+            query["_id"] = {"$gte": ObjectId.from_datetime(inserted_since)}
+        return await self._run(lambda: list(
+            self.collection.find(query).sort([("date", ASCENDING), ("_id", ASCENDING)]).limit(limit)
+        ))
+
+    async def claim_deliveries(self, reminder_ids: list, token: str = None) -> set:
+        # Marks a batch of reminders delivered in one update. Each document flips from
+        # delivered False to True atomically, so only one caller can claim it; the claim
+        # token tells this caller which ones it won.
+        token = token or uuid.uuid4().hex
+
+        def claim():
+            self.collection.update_many(
+                {"_id": {"$in": reminder_ids}, "delivered": False},
+                {"$set": {"delivered": True, "delivered_at": datetime.now(), "claim": token}},
+            )
+            claimed = list(self.collection.find({"_id": {"$in": reminder_ids}, "claim": token}, {"user_id": 1}))
+            return claimed, self._bump_versions([doc["user_id"] for doc in claimed])
+
+        claimed, versions = await self._run(claim)
+        for doc, version in zip(claimed, versions):
+            if self.cache is not None:
+                self.cache.remove(doc["user_id"], doc["_id"], version)
+            reminder_index.remove(doc["user_id"], doc["_id"], version)
+        return {doc["_id"] for doc in claimed}
+
+    async def advance_recurring(self, docs: list, token: str = None) -> dict:
+        # Moves each delivered recurring reminder on to its next occurrence, or marks it
+        # delivered once its rule has ended. The update only matches while the document still
+        # holds the occurrence being delivered, so only one caller advances it; returns
+        # {_id: next date or None} for the ones this caller advanced.
+        now = datetime.now()
+        token = token or uuid.uuid4().hex
+
+        def advance():
+            advanced = {}
+            for doc in docs:
+                next_date = next_occurrence(doc["recurrence"], doc["date"], now)
+                update = {"date": next_date} if next_date else {"delivered": True, "delivered_at": now}
+                result = self.collection.update_one(
+                    {"_id": doc["_id"], "date": doc["date"], "delivered": False},
+                    {"$set": dict(update, claim=token), "$unset": {"attempts": ""}},
+                )
+                if result.modified_count:
+                    advanced[doc["_id"]] = next_date
+            won = [doc for doc in docs if doc["_id"] in advanced]
+            return advanced, won, self._bump_versions([doc["user_id"] for doc in won])
+
+        advanced, won, versions = await self._run(advance)
+        for doc, version in zip(won, versions):
+            if advanced[doc["_id"]] is None:
+                if self.cache is not None:
+                    self.cache.remove(doc["user_id"], doc["_id"], version)
+                reminder_index.remove(doc["user_id"], doc["_id"], version)
+            else:
+                if self.cache is not None:
+                    self.cache.reschedule(doc["user_id"], doc["_id"], advanced[doc["_id"]], version)
+                reminder_index.touch(doc["user_id"], version)
+        return advanced
+
+    async def release_deliveries(self, docs: list, token: str) -> set:
+        # Undoes claim_deliveries/advance_recurring for reminders whose send failed: each goes
+        # back to its claimed date and undelivered, unless it has changed since (deleted, or
+        # claimed again). Returns the ids released.
+        def release():
+            released = []
+            for doc in docs:
+                result = self.collection.update_one(
+                    {"_id": doc["_id"], "claim": token},
+                    {"$set": {"date": doc["date"], "delivered": False}, "$unset": {"delivered_at": "", "claim": ""},
+                     "$inc": {"attempts": 1}},
+                )
+                if result.modified_count:
+                    released.append(doc)
+            self._bump_versions([doc["user_id"] for doc in released])
+            return released
+
+        released = await self._run(release)
+        # Rare enough that the affected users are simply reloaded
+        for user_id in {doc["user_id"] for doc in released}:
+            if self.cache is not None:
+                self.cache.invalidate(user_id)
+            reminder_index.drop_user(user_id)
+        return {doc["_id"] for doc in released}
+
+    async def delete_by_user(self, user_id: int) -> int:
+        def delete():
+            result = self.collection.delete_many({"user_id": user_id})
+            self._bump_versions([user_id])
+            return result
+
+        result = await self._run(delete)
+        if self.cache is not None:
+            self.cache.invalidate(user_id)
+        reminder_index.drop_user(user_id)
+        return result.deleted_count
+
+    async def delete_by_id(self, reminder_id, user_id: int = None):
+        query = {"_id": reminder_id}
+        if user_id is not None:
+            query["user_id"] = user_id
+        version = await self._write(DeleteOne(query), user_id)
+        if user_id is not None:
+            if self.cache is not None:
+                self.cache.remove(user_id, reminder_id, version)
+            reminder_index.remove(user_id, reminder_id, version)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        close_client()
+
+
+reminders = ReminderRepository()
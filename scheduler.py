@@ -0,0 +1,250 @@
+import asyncio
+import heapq
+import uuid
+import zlib
+from datetime import datetime, timedelta
+import config
+from leases import LeaseManager
+from logging_config import logger
+from repository import get_database, reminders
+
+
+def partition_for(user_id: int, partitions: int = None) -> int:
+    # Stable across processes and restarts, unlike hash()
+    partitions = partitions or config.DELIVERY_PARTITIONS
+    return zlib.crc32(str(user_id).encode()) % partitions
+
+
+class ReminderScheduler:
+    # Delivers reminders at their due time. Only reminders due within the next window are
+    # held in memory, in a min-heap ordered by due time; the heap is refilled from the
+    # (delivered, date) index as time moves on, so the collection is never scanned. Between
+    # refills it polls for reminders inserted since its last read, since other processes
+    # (e.g. the bot, when a delivery worker owns the partition) can't add to its heap.
+    def __init__(self, repository, window_seconds: float, refill_batch: int, partition: int = None,
+                 poll_seconds: float = 0):
+        self.repository = repository
+        self.partition = partition
+        self.window = timedelta(seconds=window_seconds)
+        self.refill_batch = refill_batch
+        self.poll = timedelta(seconds=poll_seconds) if poll_seconds > 0 else None
+        self._heap = []
+        self._scheduled = set()
+        # Everything due before the horizon has been loaded, as of `_read_at`
+        self._horizon = None
+        self._read_at = None
+        self._send = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.delivered_count = 0
+
+    async def start(self, send):
+        # send(chat_id, text) is awaited for every reminder that falls due
+        self._send = send
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def add(self, reminder_doc: dict):
+        # Newly created reminders join the live schedule if they fall inside the loaded range;
+        # later ones are picked up by a refill
+        if self._horizon is None or reminder_doc["date"] >= self._horizon:
+            return
+        self._push(reminder_doc)
+        self._wakeup.set()
+
+    def _push(self, reminder_doc: dict, due: datetime = None):
+        if reminder_doc["_id"] in self._scheduled:
+            return
+        self._scheduled.add(reminder_doc["_id"])
+        heapq.heappush(self._heap, (due or reminder_doc["date"], reminder_doc["_id"], reminder_doc))
+
+    async def _refill(self, now: datetime):
+        horizon = now + self.window
+        # Every refill reads the range from the start rather than resuming after the last
+        # document read: a reminder inserted meanwhile may be due before it. Reminders already
+        # in the heap are skipped by _push, delivered ones no longer match.
+        docs = await self.repository.find_due(horizon, self.refill_batch, self.partition)
+        for doc in docs:
+            self._push(doc)
+        # A full batch means more are due inside the window; only claim up to the last one read
+        self._horizon = docs[-1]["date"] if len(docs) == self.refill_batch else horizon
+        self._read_at = now
+        logger.debug("Scheduler loaded %d reminders due before %s", len(docs), self._horizon)
+
+    async def _poll_inserted(self, now: datetime):
+        # Reminders created since the last read that fall inside the loaded range; the read
+        # overlaps the previous one by a poll interval so clock drift between processes is covered
+        docs = await self.repository.find_due(self._horizon, self.refill_batch, self.partition,
+                                              inserted_since=self._read_at - self.poll)
+        for doc in docs:
+            self._push(doc)
+        self._read_at = now
+
+    async def _run(self):
+        while True:
+            try:
+                now = datetime.now()
+                if self._needs_refill(now):
+                    await self._refill(now)
+                elif self.poll is not None and now - self._read_at >= self.poll:
+                    await self._poll_inserted(now)
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    _, reminder_id, doc = heapq.heappop(self._heap)
+                    self._scheduled.discard(reminder_id)
+                    due.append(doc)
+                if due:
+                    await self._deliver(due)
+                await self._sleep(now)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error in reminder scheduler: %s", e)
+                await asyncio.sleep(1)
+
+    def _needs_refill(self, now: datetime) -> bool:
+        if self._horizon is None:
+            return True
+        # Keep at most one batch in memory; otherwise refill once half the window has passed
+        return len(self._heap) < self.refill_batch and self._horizon - now <= self.window / 2
+
+    async def _sleep(self, now: datetime):
+        wake_at = now + self.window / 2 if self._horizon is None else max(now, self._horizon - self.window / 2)
+        if self._heap:
+            wake_at = min(wake_at, self._heap[0][0])
+        if self.poll is not None and self._read_at is not None:
+            wake_at = min(wake_at, max(now, self._read_at + self.poll))
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), max(0.0, (wake_at - datetime.now()).total_seconds()))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _deliver(self, docs: list):
+        # Claim first so no other process, or a restarted one, sends them again. Recurring
+        # reminders are claimed by moving them on to their next occurrence.
+        token = uuid.uuid4().hex
+        recurring = [doc for doc in docs if doc.get("recurrence")]
+        one_shot = [doc for doc in docs if not doc.get("recurrence")]
+        claimed = await self.repository.claim_deliveries([doc["_id"] for doc in one_shot], token) if one_shot else set()
+        advanced = await self.repository.advance_recurring(recurring, token) if recurring else {}
+        for doc in recurring:
+            if advanced.get(doc["_id"]) is not None:
+                self.add(dict(doc, date=advanced[doc["_id"]]))
+        docs = [doc for doc in docs if doc["_id"] in claimed or doc["_id"] in advanced]
+        # Hand them to the sender together so reminders for the same chat can go out as one message
+        results = await asyncio.gather(
+            *(self._send(doc.get("chat_id", doc["user_id"]), f"Reminder: {doc['reminder']}") for doc in docs),
+            return_exceptions=True,
+        )
+        failed = []
+        for doc, result in zip(docs, results):
+            if isinstance(result, Exception):
+                logger.error("Error delivering reminder %s: %s", doc['_id'], result)
+                failed.append(doc)
+            else:
+                self.delivered_count += 1
+        if failed:
+            await self._retry(failed, token)
+
+    async def _retry(self, docs: list, token: str):
+        # Failed sends go back to undelivered, at the occurrence that failed, and are sent again
+        # after a growing delay. The attempt count is stored with the reminder; after a restart
+        # the retry is due right away.
+        retry = []
+        for doc in docs:
+            if doc.get("attempts", 0) + 1 < config.DELIVERY_MAX_ATTEMPTS:
+                retry.append(doc)
+            else:
+                logger.warning("Giving up on reminder %s after %d attempts", doc['_id'], config.DELIVERY_MAX_ATTEMPTS)
+        if not retry:
+            return
+        released = await self.repository.release_deliveries(retry, token)
+        now = datetime.now()
+        for doc in retry:
+            if doc["_id"] not in released:
+                continue
+            attempts = doc.get("attempts", 0) + 1
+            if doc.get("recurrence"):
+                # Its next occurrence was pushed when it was advanced; this retry replaces it
+                self._discard(doc["_id"])
+            self._push(dict(doc, attempts=attempts),
+                       now + timedelta(seconds=config.DELIVERY_RETRY_SECONDS * 2 ** (attempts - 1)))
+        self._wakeup.set()
+
+    def _discard(self, reminder_id):
+        if reminder_id in self._scheduled:
+            self._scheduled.discard(reminder_id)
+            self._heap = [entry for entry in self._heap if entry[1] != reminder_id]
+            heapq.heapify(self._heap)
+
+    def stats(self) -> dict:
+        return {"scheduled": len(self._heap), "horizon": self._horizon, "delivered": self.delivered_count}
+
+
+class PartitionedScheduler:
+    # Runs one ReminderScheduler per delivery partition this process holds a lease on, so
+    # several bot or delivery processes split the reminders between them
+    def __init__(self, repository, partitions: int, window_seconds: float, refill_batch: int, lease_seconds: float,
+                 poll_seconds: float = 0):
+        self.repository = repository
+        self.partitions = partitions
+        self.window_seconds = window_seconds
+        self.refill_batch = refill_batch
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.leases = None
+        self._schedulers = {}
+        self._send = None
+
+    async def start(self, send):
+        self._send = send
+        self.leases = LeaseManager(get_database(), self.partitions, self.lease_seconds, self._acquire, self._release)
+        await self.leases.start()
+
+    async def stop(self):
+        if self.leases is not None:
+            await self.leases.stop()
+        for partition in list(self._schedulers):
+            await self._release(partition)
+
+    async def _acquire(self, partition: int):
+        partition_scheduler = ReminderScheduler(self.repository, self.window_seconds, self.refill_batch, partition,
+                                                self.poll_seconds)
+        self._schedulers[partition] = partition_scheduler
+        await partition_scheduler.start(self._send)
+
+    async def _release(self, partition: int):
+        partition_scheduler = self._schedulers.pop(partition, None)
+        if partition_scheduler is not None:
+            await partition_scheduler.stop()
+
+    def add(self, reminder_doc: dict):
+        # Only reaches a live schedule if this process owns the reminder's partition
+        partition_scheduler = self._schedulers.get(reminder_doc.get("partition"))
+        if partition_scheduler is not None:
+            partition_scheduler.add(reminder_doc)
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.leases.owner if self.leases is not None else None,
+            "partitions": {partition: s.stats() for partition, s in sorted(self._schedulers.items())},
+        }
+
+
+scheduler = PartitionedScheduler(
+    reminders,
+    config.DELIVERY_PARTITIONS,
+    config.SCHEDULER_WINDOW_SECONDS,
+    config.SCHEDULER_REFILL_BATCH,
+    config.DELIVERY_LEASE_SECONDS,
+    config.SCHEDULER_POLL_SECONDS,
+)
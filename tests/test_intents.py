@@ -0,0 +1,42 @@
+from intents import keyword_tier
+
+
+def intent(text):
+    result = keyword_tier(text.lower())
+    return result.intent, result.confidence
+
+
+def test_remind_me_to_clear_is_a_reminder():
+    name, confidence = intent("remind me to clear the gutters on saturday")
+    assert name == "reminder" and confidence < 0.8
+
+
+def test_remind_me_to_show_is_a_reminder():
+    name, confidence = intent("remind me to show John the house at 5pm")
+    assert name == "reminder" and confidence < 0.8
+
+
+def test_question_words_inside_a_reminder():
+    name, confidence = intent("remind me to ask mom what she wants for dinner at 6pm")
+    assert name == "reminder" and confidence < 0.8
+
+
+def test_plain_reminder_is_confident():
+    assert intent("remind me to call bob tomorrow at 5pm") == ("reminder", 0.9)
+
+
+def test_commands_on_reminders():
+    assert intent("show my reminders")[0] == "list_reminders"
+    assert intent("clear all my reminders") == ("clear_reminders", 0.95)
+    assert intent("delete my reminder to clear the gutters") == ("delete_reminder", 0.95)
+    assert intent("what reminders do i have")[0] == "list_reminders"
+
+
+def test_clear_needs_reminders_or_clear_all():
+    assert intent("clear the gutters tomorrow")[0] != "clear_reminders"
+    assert intent("clear all")[0] == "clear_reminders"
+
+
+def test_leading_command_without_reminders_is_not_confident():
+    name, confidence = intent("show John the house")
+    assert name == "list_reminders" and confidence < 0.8
@@ -0,0 +1,95 @@
+import asyncio
+from telegram.error import RetryAfter
+from outbound import INTERACTIVE, SCHEDULED, OutboundQueue
+
+
+class FakeBot:
+    # Records sends; retry_after maps chat ids to the number of sends answered with a 429
+    def __init__(self, delay=0.0, retry_after=None, retry_seconds=0.2):
+        self.delay = delay
+        self.retry_after = dict(retry_after or {})
+        self.retry_seconds = retry_seconds
+        self.sent = []
+        self.active = 0
+        self.max_active = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.retry_after.get(chat_id):
+                self.retry_after[chat_id] -= 1
+                raise RetryAfter(self.retry_seconds)
+            self.sent.append((chat_id, text, asyncio.get_running_loop().time()))
+            return text
+        finally:
+            self.active -= 1
+
+
+def run_queue(bot, sends, chat_rate=100.0, chat_burst=100.0):
+    # sends: (chat_id, text, priority) enqueued before the queue starts sending
+    async def run():
+        queue = OutboundQueue(1000, chat_rate, chat_burst)
+        pending = [asyncio.create_task(queue.send(chat_id, text, priority)) for chat_id, text, priority in sends]
+        await asyncio.sleep(0)
+        queue.start(bot)
+        results = await asyncio.gather(*pending)
+        await queue.stop()
+        return queue, results
+
+    return asyncio.run(run())
+
+
+def test_replies_go_before_deliveries():
+    bot = FakeBot()
+    run_queue(bot, [(1, "reminder", SCHEDULED), (2, "reply", INTERACTIVE)])
+    assert [text for _, text, _ in bot.sent] == ["reply", "reminder"]
+
+
+def test_scheduled_messages_for_a_chat_are_merged():
+    bot = FakeBot()
+    queue, results = run_queue(bot, [(1, "Reminder: a", SCHEDULED), (1, "Reminder: b", SCHEDULED)])
+    assert [text for _, text, _ in bot.sent] == ["Reminder: a\nReminder: b"]
+    assert results == ["Reminder: a\nReminder: b"] * 2
+    assert queue.coalesced == 1
+
+
+def test_sends_to_different_chats_run_concurrently():
+    bot = FakeBot(delay=0.05)
+    run_queue(bot, [(chat_id, "hi", INTERACTIVE) for chat_id in range(5)])
+    assert bot.max_active == 5
+
+
+def test_one_send_in_flight_per_chat_in_order():
+    bot = FakeBot(delay=0.01)
+    run_queue(bot, [(1, str(n), INTERACTIVE) for n in range(5)])
+    assert bot.max_active == 1
+    assert [text for _, text, _ in bot.sent] == ["0", "1", "2", "3", "4"]
+
+
+def test_retry_after_only_pauses_that_chat():
+    bot = FakeBot(retry_after={1: 1}, retry_seconds=0.2)
+    queue, _ = run_queue(bot, [(1, "slow", INTERACTIVE), (2, "a", INTERACTIVE), (2, "b", INTERACTIVE)])
+    times = {text: at for _, text, at in bot.sent}
+    assert times["slow"] - times["b"] >= 0.15
+    assert queue.retries == 1
+
+
+def test_retry_after_for_several_chats_pauses_all():
+    bot = FakeBot(delay=0.01, retry_after={1: 1, 2: 1}, retry_seconds=0.2)
+
+    async def run():
+        queue = OutboundQueue(1000, 100, 100)
+        queue.start(bot)
+        first = [asyncio.create_task(queue.send(chat_id, "first", INTERACTIVE)) for chat_id in (1, 2)]
+        await asyncio.sleep(0.05)
+        started = asyncio.get_running_loop().time()
+        await queue.send(3, "later", INTERACTIVE)
+        waited = asyncio.get_running_loop().time() - started
+        await asyncio.gather(*first)
+        await queue.stop()
+        return waited
+
+    # chat 3 never got a 429 but waits out the pause
+    assert asyncio.run(run()) >= 0.1
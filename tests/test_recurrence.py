@@ -0,0 +1,87 @@
+from datetime import datetime
+from recurrence import describe, next_occurrence, parse_recurrence
+from reminder import fast_path_date
+
+NOW = datetime(2026, 10, 18, 14, 30)  # a Sunday
+
+
+def test_adjective_before_noun_is_not_a_recurrence():
+    assert parse_recurrence("remind me to buy the weekly groceries tomorrow", NOW) is None
+    assert parse_recurrence("check the daily report at 5pm", NOW) is None
+    assert parse_recurrence("send the monthly invoice on friday", NOW) is None
+
+
+def test_adjective_phrasings_fall_back_to_one_off_dates():
+    date, recurrence, _ = fast_path_date("remind me to buy the weekly groceries tomorrow", NOW)
+    assert recurrence is None and date.date() == datetime(2026, 10, 19).date()
+    assert fast_path_date("check the daily report at 5pm", NOW)[:2] == (datetime(2026, 10, 18, 17, 0), None)
+    date, recurrence, _ = fast_path_date("send the monthly invoice on friday", NOW)
+    assert recurrence is None and date.date() == datetime(2026, 10, 23).date()
+
+
+def test_adverb_at_end_of_clause_recurs():
+    match = parse_recurrence("remind me to water the plants daily", NOW)
+    assert match.rule == "FREQ=DAILY;BYHOUR=9;BYMINUTE=0;BYSECOND=0"
+    assert match.first == datetime(2026, 10, 19, 9, 0)
+
+
+def test_adverb_before_time_recurs():
+    match = parse_recurrence("take my pills daily at 8pm", NOW)
+    assert match.first == datetime(2026, 10, 18, 20, 0)
+    assert describe(match.rule) == "every day at 20:00"
+
+
+def test_adverb_before_punctuation_recurs():
+    assert parse_recurrence("review the budget weekly, please", NOW).rule.startswith("FREQ=WEEKLY")
+
+
+def test_every_weekday_at_nine():
+    match = parse_recurrence("stretch every weekday at 9", NOW)
+    assert match.first == datetime(2026, 10, 19, 9, 0)
+    assert next_occurrence(match.rule, match.first) == datetime(2026, 10, 20, 9, 0)
+
+
+def test_every_other_week_counts_from_first_occurrence():
+    match = parse_recurrence("team sync every 2 weeks on friday at 7pm", NOW)
+    assert match.first == datetime(2026, 10, 23, 19, 0)
+    assert next_occurrence(match.rule, match.first) == datetime(2026, 11, 6, 19, 0)
+
+
+def test_missed_occurrences_collapse_into_the_next():
+    assert next_occurrence("FREQ=DAILY;BYHOUR=9;BYMINUTE=0;BYSECOND=0", datetime(2026, 10, 1, 9, 0), NOW) \
+        == datetime(2026, 10, 19, 9, 0)
+
+
+def test_part_of_day_after_weekday():
+    match = parse_recurrence("call mum every monday evening", NOW)
+    assert match.first == datetime(2026, 10, 19, 19, 0)
+    assert match.rule == "FREQ=WEEKLY;BYDAY=MO;BYHOUR=19;BYMINUTE=0;BYSECOND=0"
+    assert match.spans == [(9, 21), (21, 29)]
+
+
+def test_part_of_day_after_plural_weekdays():
+    match = parse_recurrence("run on weekdays in the morning", NOW)
+    assert match.first == datetime(2026, 10, 19, 9, 0)
+    assert fast_path_date("run on weekdays in the morning", NOW)[0] == datetime(2026, 10, 19, 9, 0)
+
+
+def test_explicit_time_wins_over_part_of_day():
+    assert parse_recurrence("call mum every monday evening at 8pm", NOW).first == datetime(2026, 10, 19, 20, 0)
+
+
+def test_yearly_rule_starts_on_explicit_date():
+    match = parse_recurrence("renew passport every year on 12/03/2027", NOW)
+    assert match.first == datetime(2027, 12, 3, 9, 0)
+    assert next_occurrence(match.rule, match.first) == datetime(2028, 12, 3, 9, 0)
+    assert len(match.spans) == 2
+
+
+def test_yearly_rule_with_past_date_recurs_on_its_day():
+    match = parse_recurrence("anniversary every year on 12/03/2020 at 8pm", NOW)
+    assert match.first == datetime(2026, 12, 3, 20, 0)
+
+
+def test_monthly_rule_takes_day_from_explicit_date():
+    match = parse_recurrence("pay rent every month on 11/05/2026", NOW)
+    assert match.first == datetime(2026, 11, 5, 9, 0)
+    assert next_occurrence(match.rule, match.first) == datetime(2026, 12, 5, 9, 0)
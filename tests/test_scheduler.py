@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime, timedelta
+import mongomock
+import config
+from repository import ReminderRepository
+from scheduler import ReminderScheduler
+
+
+def make_repository():
+    return ReminderRepository(mongomock.MongoClient()["nous"]["reminders"], max_workers=1, write_buffer=False)
+
+
+def run_deliveries(repository, sends, seconds=0.3):
+    # Runs a scheduler against the repository; sends is a list of results (or exceptions) for successive sends
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append((chat_id, text))
+        result = sends.pop(0) if sends else None
+        if isinstance(result, Exception):
+            raise result
+
+    async def run():
+        scheduler = ReminderScheduler(repository, 60, 100)
+        await scheduler.start(send)
+        await asyncio.sleep(seconds)
+        await scheduler.stop()
+        return scheduler
+
+    return sent, asyncio.run(run())
+
+
+def test_delivers_due_reminder():
+    repository = make_repository()
+    due = datetime.now() - timedelta(seconds=1)
+    asyncio.run(repository.insert({"user_id": 1, "reminder": "call bob", "date": due, "delivered": False}))
+    sent, scheduler = run_deliveries(repository, [])
+    assert sent == [(1, "Reminder: call bob")]
+    assert scheduler.delivered_count == 1
+    assert repository.collection.find_one()["delivered"] is True
+
+
+def test_failed_send_is_released_and_retried(monkeypatch):
+    monkeypatch.setattr(config, "DELIVERY_RETRY_SECONDS", 0.05)
+    repository = make_repository()
+    due = datetime.now() - timedelta(seconds=1)
+    asyncio.run(repository.insert({"user_id": 1, "reminder": "call bob", "date": due, "delivered": False}))
+    sent, scheduler = run_deliveries(repository, [RuntimeError("network down")])
+    assert sent == [(1, "Reminder: call bob")] * 2
+    assert scheduler.delivered_count == 1
+    doc = repository.collection.find_one()
+    assert doc["delivered"] is True and doc["attempts"] == 1
+
+
+def test_failed_send_left_undelivered_until_retry(monkeypatch):
+    monkeypatch.setattr(config, "DELIVERY_RETRY_SECONDS", 60)
+    repository = make_repository()
+    due = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+    asyncio.run(repository.insert({"user_id": 1, "reminder": "call bob", "date": due, "delivered": False}))
+    sent, scheduler = run_deliveries(repository, [RuntimeError("network down")])
+    assert len(sent) == 1 and scheduler.delivered_count == 0
+    doc = repository.collection.find_one()
+    assert doc["delivered"] is False and doc["date"] == due and "claim" not in doc
+
+
+def test_failed_recurring_send_keeps_its_occurrence(monkeypatch):
+    monkeypatch.setattr(config, "DELIVERY_RETRY_SECONDS", 60)
+    repository = make_repository()
+    due = datetime.now().replace(microsecond=0) - timedelta(seconds=1)
+    asyncio.run(repository.insert({"user_id": 1, "reminder": "stretch", "date": due, "delivered": False,
+                                   "recurrence": "FREQ=DAILY"}))
+    sent, scheduler = run_deliveries(repository, [RuntimeError("network down")])
+    assert len(sent) == 1
+    doc = repository.collection.find_one()
+    assert doc["delivered"] is False and doc["date"] == due
+
+
+def test_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(config, "DELIVERY_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(config, "DELIVERY_MAX_ATTEMPTS", 2)
+    repository = make_repository()
+    due = datetime.now() - timedelta(seconds=1)
+    asyncio.run(repository.insert({"user_id": 1, "reminder": "call bob", "date": due, "delivered": False}))
+    sent, scheduler = run_deliveries(repository, [RuntimeError("blocked")] * 5)
+    assert len(sent) == 2 and scheduler.delivered_count == 0
+    assert repository.collection.find_one()["delivered"] is True
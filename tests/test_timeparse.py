@@ -0,0 +1,59 @@
+from datetime import datetime
+from timeparse import parse_time_phrases
+
+NOW = datetime(2026, 10, 18, 14, 30)  # a Sunday
+
+
+def test_relative_days_keeps_the_time_of_day():
+    match = parse_time_phrases("water plants in 3 days at 9am", NOW)
+    assert match.date == datetime(2026, 10, 21, 9, 0)
+    assert len(match.spans) == 2
+
+
+def test_relative_weeks_with_part_of_day():
+    assert parse_time_phrases("call mum in 2 weeks in the evening", NOW).date == datetime(2026, 11, 1, 19, 0)
+
+
+def test_relative_hours_stay_exact():
+    assert parse_time_phrases("stretch in 2 hours", NOW).date == datetime(2026, 10, 18, 16, 30)
+
+
+def test_relative_days_without_time():
+    assert parse_time_phrases("pay rent in 3 days", NOW).date == datetime(2026, 10, 21, 14, 30)
+
+
+def test_dotted_amount_is_not_a_time():
+    assert parse_time_phrases("remind me to pay 5.30 dollars", NOW) is None
+
+
+def test_dotted_time_needs_at():
+    assert parse_time_phrases("call bob at 5.30", NOW).date == datetime(2026, 10, 19, 5, 30)
+
+
+def test_colon_time_without_at():
+    assert parse_time_phrases("call bob 17:45", NOW).date == datetime(2026, 10, 18, 17, 45)
+
+
+def test_twelve_hour_time():
+    assert parse_time_phrases("call bob tomorrow at 9.15pm", NOW).date == datetime(2026, 10, 19, 21, 15)
+
+
+def test_bare_hour_after_day():
+    assert parse_time_phrases("remind me tomorrow at 10", NOW).date == datetime(2026, 10, 19, 10, 0)
+
+
+def test_bare_hour_tonight_is_pm():
+    assert parse_time_phrases("remind me tonight at 10", NOW).date == datetime(2026, 10, 18, 22, 0)
+
+
+def test_bare_hour_after_weekday():
+    assert parse_time_phrases("call the bank on friday at 10", NOW).date == datetime(2026, 10, 23, 10, 0)
+
+
+def test_bare_hour_alone_is_next_occurrence():
+    assert parse_time_phrases("stand up at 9", NOW).date == datetime(2026, 10, 19, 9, 0)
+
+
+def test_bare_hour_span_is_removed():
+    match = parse_time_phrases("remind me tomorrow at 10", NOW)
+    assert sorted(match.spans) == [(10, 18), (19, 24)]
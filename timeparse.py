@@ -0,0 +1,143 @@
+import re
+from datetime import datetime, timedelta
+import dateparser
+import config
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+PARTS_OF_DAY = {"morning": (9, 0), "afternoon": (15, 0), "evening": (19, 0), "night": (21, 0)}
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+                "seven": 7, "eight": 8, "nine": 9, "ten": 10, "fifteen": 15, "twenty": 20, "thirty": 30}
+UNITS = {"min": "minutes", "minute": "minutes", "hr": "hours", "hour": "hours", "day": "days", "week": "weeks"}
+
+# One compiled grammar for the common English forms; every alternative is a named group
+# so a single finditer pass yields both the values and their character spans. A dotted
+# 24-hour time needs "at" ("at 5.30"), so amounts like "5.30 dollars" aren't read as times.
+# A bare "at 10" is an hour, read as pm when the message also says evening or tonight.
+TIME_GRAMMAR = re.compile(r"""
+    \b(?:
+        (?P<relative>in\s+(?P<amount>\d+|""" + "|".join(NUMBER_WORDS) + r""")\s+(?P<unit>min|minute|hr|hour|day|week)s?)
+      | (?P<time12>(?:at\s+)?(?P<hour12>\d{1,2})(?:[:.](?P<minute12>\d{2}))?\s*(?P<meridiem>[ap])\.?m\.?)
+      | (?P<time24>(?:at\s+(?=\d{1,2}[:.])|(?=\d{1,2}:))(?P<hour24>\d{1,2})[:.](?P<minute24>\d{2}))
+      | (?P<hour_at>at\s+(?P<bare_hour>\d{1,2})(?![:./\d]))
+      | (?P<date>(?:on\s+)?(?P<first>\d{1,2})/(?P<second>\d{1,2})/(?P<year>\d{4}|\d{2}))
+      | (?P<day>today|tonight|tomorrow)
+      | (?P<weekday>(?:on\s+)?(?:(?P<next>next)\s+)?(?P<weekday_name>""" + "|".join(WEEKDAYS) + r"""))
+      | (?P<part>(?:in\s+the\s+|this\s+)?(?P<part_name>""" + "|".join(PARTS_OF_DAY) + r"""))
+    )(?!\w)
+""", re.IGNORECASE | re.VERBOSE)
+
+# Restricted profile for messages the fast path can't handle
+DATEPARSER_LANGUAGES = ['en']
+DATEPARSER_SETTINGS = {
+    'PREFER_DATES_FROM': 'future',
+    'DATE_ORDER': config.DATE_ORDER,
+    'RETURN_AS_TIMEZONE_AWARE': False,
+    'PARSERS': ['relative-time', 'absolute-time'],
+}
+
+
+class TimeMatch:
+    def __init__(self, date: datetime, spans: list):
+        self.date = date
+        # (start_char, end_char) of every phrase that contributed to the date
+        self.spans = spans
+
+
+def date_from_parts(first: int, second: int, year: int):
+    if year < 100:
+        year += 2000
+    day, month = (first, second) if config.DATE_ORDER.startswith('D') else (second, first)
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_time_phrases(text: str, now: datetime = None):
+    # Fast path: returns a TimeMatch, or None when no supported phrase is found
+    now = now or datetime.now()
+    spans = []
+    relative = None
+    relative_unit = None
+    bare_hour = False
+    day = None
+    time = None
+    default_time = None
+    explicit_date = False
+    weekday = None
+
+    for match in TIME_GRAMMAR.finditer(text):
+        groups = match.groupdict()
+        if groups['relative'] and relative is None:
+            amount = groups['amount'].lower()
+            amount = int(amount) if amount.isdigit() else NUMBER_WORDS[amount]
+            relative_unit = UNITS[groups['unit'].lower()]
+            relative = timedelta(**{relative_unit: amount})
+        elif groups['time12'] and time is None:
+            hour, minute = int(groups['hour12']), int(groups['minute12'] or 0)
+            if not 1 <= hour <= 12 or minute > 59:
+                continue
+            hour = hour % 12 + (12 if groups['meridiem'].lower() == 'p' else 0)
+            time = (hour, minute)
+        elif groups['time24'] and time is None:
+            hour, minute = int(groups['hour24']), int(groups['minute24'])
+            if hour > 23 or minute > 59:
+                continue
+            time = (hour, minute)
+        elif groups['hour_at'] and time is None:
+            hour = int(groups['bare_hour'])
+            if hour > 23:
+                continue
+            time = (hour, 0)
+            bare_hour = True
+        elif groups['date'] and day is None and weekday is None:
+            day = date_from_parts(int(groups['first']), int(groups['second']), int(groups['year']))
+            if day is None:
+                continue
+            explicit_date = True
+        elif groups['day'] and day is None and weekday is None:
+            name = groups['day'].lower()
+            day = now + timedelta(days=1) if name == 'tomorrow' else now
+            if name == 'tonight':
+                default_time = PARTS_OF_DAY['night']
+        elif groups['weekday'] and day is None and weekday is None:
+            weekday = (WEEKDAYS.index(groups['weekday_name'].lower()), bool(groups['next']))
+        elif groups['part'] and default_time is None:
+            default_time = PARTS_OF_DAY[groups['part_name'].lower()]
+        else:
+            continue
+        spans.append(match.span())
+
+    if not spans:
+        return None
+    if bare_hour and default_time is not None and default_time[0] >= 12 and time[0] < 12:
+        time = (time[0] + 12, time[1])
+    time = time or default_time
+    if relative is not None:
+        # "in 3 days at 9am" lands on the target day at that time; "in 2 hours" is exact
+        if time is not None and relative_unit in ("days", "weeks"):
+            return TimeMatch((now + relative).replace(hour=time[0], minute=time[1], second=0, microsecond=0), spans)
+        return TimeMatch(now + relative, spans)
+
+    if weekday is not None:
+        index, is_next = weekday
+        days_ahead = (index - now.weekday()) % 7
+        if days_ahead == 0 and (is_next or time is None or (time[0], time[1]) <= (now.hour, now.minute)):
+            days_ahead = 7
+        day = now + timedelta(days=days_ahead)
+
+    if day is None:
+        # Only a time of day: the next time it comes round
+        candidate = now.replace(hour=time[0], minute=time[1], second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        return TimeMatch(candidate, spans)
+    if time is not None:
+        return TimeMatch(day.replace(hour=time[0], minute=time[1], second=0, microsecond=0), spans)
+    if explicit_date:
+        return TimeMatch(day, spans)
+    return TimeMatch(day.replace(microsecond=0), spans)
+
+
+def parse_with_dateparser(text: str):
+    return dateparser.parse(text, languages=DATEPARSER_LANGUAGES, settings=DATEPARSER_SETTINGS)
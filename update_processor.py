@@ -0,0 +1,53 @@
+from collections import deque
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from logging_config import logger
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    # Processes updates from different chats concurrently (up to max_concurrent_updates)
+    # while updates from the same chat still run one at a time, in arrival order. Each busy
+    # chat has a queue drained by the update that found it idle; later updates for the chat
+    # only enqueue and return, so a chat queueing behind itself holds a single concurrency slot.
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_queues = {}
+
+    @staticmethod
+    def _chat_key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        if key is None:
+            await coroutine
+            return
+        queue = self._chat_queues.get(key)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+        queue = self._chat_queues[key] = deque([coroutine])
+        try:
+            while queue:
+                try:
+                    await queue[0]
+                except Exception as e:
+                    logger.error("Error processing update for chat %s: %s", key, e)
+                queue.popleft()
+        finally:
+            del self._chat_queues[key]
+            # Only reached if this task was cancelled mid-drain; don't leave coroutines unawaited
+            for pending in queue:
+                pending.close()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
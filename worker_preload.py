@@ -0,0 +1,12 @@
+import gc
+import config
+from models import registry
+import workers  # noqa: F401  (so workers don't import spaCy, dateparser etc. themselves)
+
+# Imported once by the forkserver when NLP_WORKER_START_METHOD=forkserver. The models loaded
+# here are inherited by every worker it forks, sharing their pages copy-on-write, so workers
+# start without loading anything and the weights are in memory once.
+registry.warm_up(config.NLP_WORKER_PRELOAD_MODELS, background=False)
+# Move everything loaded so far out of the garbage collector's reach; collections would
+# otherwise write to the objects' headers and copy the shared pages into each worker
+gc.freeze()
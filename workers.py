@@ -0,0 +1,236 @@
+import asyncio
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import config
+from analysis import MessageAnalysis, normalize_text, parse_batch
+from batching import MicroBatcher
+from intents import IntentResult, cascade_stats, classify_intent
+from logging_config import logger
+from message_cache import CachedParse, message_cache
+from metrics import metrics
+from models import get_nlp
+from reminder import Reminder, fast_path_date, format_reminder_text
+
+
+class ParsedMessage:
+    # Picklable result of the CPU-bound part of handling a message
+    def __init__(self, intent: IntentResult, text: str, cleaned_message: str = None, parsed_date=None,
+                 reminder_text: str = None, error: str = None, timings: dict = None, recurrence: str = None,
+                 date_source: str = None):
+        self.intent = intent.intent
+        self.intent_result = intent
+        # Seconds per stage (intent, spacy, dateparser) measured wherever the message was parsed
+        self.timings = timings or {}
+        self.text = text
+        self.cleaned_message = cleaned_message
+        self.parsed_date = parsed_date
+        # RRULE string for recurring reminders; parsed_date is then their first occurrence
+        self.recurrence = recurrence
+        # Which parser found the date; the message cache only keeps grammar-parsed reminders
+        self.date_source = date_source
+        self.reminder_text = reminder_text
+        self.error = error
+
+
+def _timings(intent: IntentResult, analysis: MessageAnalysis, reminder: Reminder = None) -> dict:
+    timings = {"intent": sum(intent.timings.values())}
+    if analysis.is_parsed:
+        timings["spacy"] = analysis.parse_seconds
+    if reminder is not None:
+        timings.update(reminder.timings)
+    return timings
+
+
+def _reminder_result(intent: IntentResult, user_id: int, analysis: MessageAnalysis) -> ParsedMessage:
+    reminder = Reminder(user_id, analysis.text, analysis=analysis)
+    return ParsedMessage(intent, analysis.text, reminder.cleaned_message, reminder.parsed_date,
+                         reminder.get_reminder_text(), timings=_timings(intent, analysis, reminder),
+                         recurrence=reminder.recurrence, date_source=reminder.date_source)
+
+
+def _error_result(intent: IntentResult, analysis: MessageAnalysis, error: str) -> ParsedMessage:
+    return ParsedMessage(intent, analysis.text, error=error, timings=_timings(intent, analysis))
+
+
+def _cached_result(cached: CachedParse, text: str):
+    # Rebuilds a result from the message cache, or None if this message's date no longer
+    # parses with the grammar (e.g. "at 25:00"); the date is always parsed afresh
+    text = normalize_text(text)
+    if cached.date_source is None:
+        return ParsedMessage(cached.intent_result, text)
+    fast = fast_path_date(text)
+    if fast is None:
+        return None
+    parsed_date, recurrence, _ = fast
+    return ParsedMessage(cached.intent_result, text, cached.cleaned_message, parsed_date,
+                         format_reminder_text(cached.cleaned_message, parsed_date, recurrence),
+                         recurrence=recurrence, date_source=cached.date_source)
+
+
+def parse_messages(items: list) -> list:
+    # Runs inside a worker process: intent recognition for every (user_id, text) pair, then
+    # one nlp.pipe call for all reminders in the batch before extracting their dates and text
+    results = [None] * len(items)
+    reminders = []
+    for i, (user_id, text) in enumerate(items):
+        analysis = MessageAnalysis(text)
+        intent = classify_intent(analysis.text, analysis)
+        if intent.intent == "reminder":
+            reminders.append((i, user_id, analysis, intent))
+        else:
+            results[i] = ParsedMessage(intent, analysis.text, timings=_timings(intent, analysis))
+
+    if reminders:
+        if get_nlp() is None:
+            for i, _, analysis, intent in reminders:
+                results[i] = _error_result(intent, analysis, "spaCy model is not available")
+            return results
+        # Messages the intent cascade already parsed keep their Doc
+        unparsed = [analysis for _, _, analysis, _ in reminders if not analysis.is_parsed]
+        if unparsed:
+            start = time.perf_counter()
+            docs = parse_batch([analysis.text for analysis in unparsed])
+            # Each message is charged an equal share of the batch
+            share = (time.perf_counter() - start) / len(unparsed)
+            for analysis, doc in zip(unparsed, docs):
+                analysis.doc = doc
+                analysis.parse_seconds = share
+        for i, user_id, analysis, intent in reminders:
+            try:
+                results[i] = _reminder_result(intent, user_id, analysis)
+            except Exception as e:
+                results[i] = _error_result(intent, analysis, str(e))
+    return results
+
+
+def _init_worker():
+    # Each worker loads the spaCy model once, before it takes any task; forkserver workers
+    # inherit it already loaded
+    start = time.perf_counter()
+    get_nlp()
+    logger.debug("NLP worker ready in %.3fs", time.perf_counter() - start)
+
+
+def _ping():
+    return True
+
+
+class MessageProcessor:
+    # Runs intent recognition and reminder parsing either in a pool of worker processes,
+    # each holding a warm spaCy model, or in-process when workers is 0 (e.g. for tests)
+    def __init__(self, workers: int, max_pending: int, max_tasks_per_worker: int, start_method: str = "spawn"):
+        self.workers = workers
+        self.start_method = start_method
+        self.max_pending = max(1, max_pending)
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._pool = None
+        self._semaphore = None
+        self._batcher = MicroBatcher(self._submit_batch, config.NLP_BATCH_WINDOW_MS, config.NLP_BATCH_MAX_SIZE)
+
+    def start(self):
+        if self.workers <= 0 or self._pool is not None:
+            return
+        kwargs = {}
+        if self.max_tasks_per_worker > 0:
+            if sys.version_info >= (3, 11):
+                kwargs["max_tasks_per_child"] = self.max_tasks_per_worker
+            else:
+                logger.warning("Worker recycling needs Python 3.11+, workers will not be recycled")
+        start_method = self.start_method
+        if start_method not in ("spawn", "forkserver") or start_method not in multiprocessing.get_all_start_methods():
+            logger.warning("Worker start method '%s' is not supported here, using spawn", start_method)
+            start_method = "spawn"
+        context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            context.set_forkserver_preload(["worker_preload"])
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            **kwargs,
+        )
+        # Workers are spawned on demand, so start them all now to load the models up front
+        for _ in range(self.workers):
+            self._pool.submit(_ping)
+        logger.info("Started %d NLP worker processes", self.workers)
+
+    async def _submit_batch(self, items: list) -> list:
+        # Awaits the worker process without holding a thread of the default pool, which the
+        # lease heartbeats and in-process parses share
+        pool = self._pool
+        try:
+            return await asyncio.wrap_future(pool.submit(parse_messages, items))
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed for memory); replace the pool so later messages work,
+            # and answer this batch with errors instead of raising out of the handlers
+            logger.error("NLP worker pool broke, restarting it: %s", e)
+            if self._pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+                self.start()
+            return [ParsedMessage(IntentResult("fallback", 0.0, "keywords"), text, error="NLP worker crashed")
+                    for _, text in items]
+
+    async def process(self, user_id: int, text: str) -> ParsedMessage:
+        cached = message_cache.get(text)
+        parsed = _cached_result(cached, text) if cached is not None else None
+        if parsed is not None:
+            message_cache.record_hit()
+            metrics.count("message_cache_lookups", result="hit")
+            return parsed
+        message_cache.record_miss()
+        metrics.count("message_cache_lookups", result="miss")
+
+        if self._pool is None:
+            parsed = await self._process_in_process(user_id, text)
+        else:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.max_pending)
+            # Back-pressure: when max_pending messages are in flight, new ones wait here
+            async with self._semaphore:
+                parsed = await self._batcher.submit((user_id, text))
+        # Cascade counters and stage timings are kept here so they cover the worker processes too
+        if parsed.intent_result.timings:
+            cascade_stats.record(parsed.intent_result)
+        for stage, seconds in parsed.timings.items():
+            metrics.observe(stage, seconds, parsed.intent)
+        message_cache.put(text, parsed)
+        return parsed
+
+    async def _process_in_process(self, user_id: int, text: str) -> ParsedMessage:
+        analysis = MessageAnalysis(text)
+        # The model tiers may load and run spaCy, so keep the cascade off the event loop
+        intent = await asyncio.to_thread(classify_intent, analysis.text, analysis)
+        if intent.intent != "reminder":
+            return ParsedMessage(intent, analysis.text, timings=_timings(intent, analysis))
+        # The first call may load the model, so keep it off the event loop
+        nlp = await asyncio.to_thread(get_nlp)
+        if nlp is None:
+            return _error_result(intent, analysis, "spaCy model is not available")
+        try:
+            await analysis.parse()
+            return _reminder_result(intent, user_id, analysis)
+        except Exception as e:
+            return _error_result(intent, analysis, str(e))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers if self._pool is not None else 0,
+            "max_pending": self.max_pending,
+            "in_flight": self.max_pending - self._semaphore._value if self._semaphore is not None else 0,
+            "batching": self._batcher.stats(),
+            "intent_cascade": cascade_stats.snapshot(),
+            "message_cache": message_cache.stats(),
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+processor = MessageProcessor(config.NLP_WORKERS, config.NLP_MAX_PENDING, config.NLP_WORKER_MAX_TASKS,
+                             config.NLP_WORKER_START_METHOD)